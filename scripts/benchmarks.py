@@ -0,0 +1,234 @@
+#!/bin/python
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+import regex
+from binary_dict import write_binary_dict
+from wordlist_combined import read_entries
+from wordlist import find_dict, unmunch_word, affix_index, classify_token, Wordlist, \
+    TOKEN_WORD, TOKEN_BREAK, TOKEN_SPACE, TOKEN_INVALID, TOKEN_NOT_WORD
+
+# rough timings for comparing faster implementations against the previous ones
+# results are also checked for equality, as the faster implementations should not change the output
+
+
+# unmunch_word as it was before AffixIndex, i.e. same as
+# https://github.com/zverok/spylls/blob/master/examples/unmunch.py
+def unmunch_word_reference(word, aff):
+    result = set()
+
+    if aff.FORBIDDENWORD and aff.FORBIDDENWORD in word.flags:
+        return result
+
+    if not (aff.NEEDAFFIX and aff.NEEDAFFIX in word.flags):
+        result.add(word.stem)
+
+    suffixes = [
+        suffix
+        for flag in word.flags
+        for suffix in aff.SFX.get(flag, [])
+        if suffix.cond_regexp.search(word.stem)
+    ]
+    prefixes = [
+        prefix
+        for flag in word.flags
+        for prefix in aff.PFX.get(flag, [])
+        if prefix.cond_regexp.search(word.stem)
+    ]
+
+    for suffix in suffixes:
+        root = word.stem[0:-len(suffix.strip)] if suffix.strip else word.stem
+        suffixed = root + suffix.add
+        if not (aff.NEEDAFFIX and aff.NEEDAFFIX in suffix.flags):
+            result.add(suffixed)
+
+        secondary_suffixes = [
+            suffix2
+            for flag in suffix.flags
+            for suffix2 in aff.SFX.get(flag, [])
+            if suffix2.cond_regexp.search(suffixed)
+        ]
+        for suffix2 in secondary_suffixes:
+            root = suffixed[0:-len(suffix2.strip)] if suffix2.strip else suffixed
+            result.add(root + suffix2.add)
+
+    for prefix in prefixes:
+        root = word.stem[len(prefix.strip):]
+        prefixed = prefix.add + root
+        if not (aff.NEEDAFFIX and aff.NEEDAFFIX in prefix.flags):
+            result.add(prefixed)
+
+        if prefix.crossproduct:
+            additional_suffixes = [
+                suffix
+                for flag in prefix.flags
+                for suffix in aff.SFX.get(flag, [])
+                if suffix.crossproduct and not suffix in suffixes and suffix.cond_regexp.search(prefixed)
+            ]
+            for suffix in suffixes + additional_suffixes:
+                root = prefixed[0:-len(suffix.strip)] if suffix.strip else prefixed
+                suffixed = root + suffix.add
+                result.add(suffixed)
+
+                secondary_suffixes = [
+                    suffix2
+                    for flag in suffix.flags
+                    for suffix2 in aff.SFX.get(flag, [])
+                    if suffix2.crossproduct and suffix2.cond_regexp.search(suffixed)
+                ]
+                for suffix2 in secondary_suffixes:
+                    root = suffixed[0:-len(suffix2.strip)] if suffix2.strip else suffixed
+                    result.add(root + suffix2.add)
+
+    return result
+
+
+# compare unmunch_word with and without AffixIndex
+# only a random sample of stems is used, as unmunching the full dictionary takes very long for some locales
+#  (set sample_size to None to use all stems)
+def benchmark_unmunch(locales=("cs_CZ", "it_IT", "de_DE"), sample_size: int | None = 20000):
+    for loc in locales:
+        dictionary = find_dict(loc)
+        words = dictionary.dic.words
+        if sample_size is not None and sample_size < len(words):
+            words = random.Random(0).sample(words, sample_size)
+
+        t = time.time()
+        reference = set()
+        for word in words:
+            reference.update(unmunch_word_reference(word, dictionary.aff))
+        reference_time = time.time() - t
+
+        t = time.time()
+        index = affix_index(dictionary)  # creation time is included
+        result = set()
+        for word in words:
+            result.update(unmunch_word(word, dictionary.aff, index))
+        index_time = time.time() - t
+
+        print(f"unmunch {loc}: {len(words)} stems, {len(result)} words, "
+              f"reference {reference_time:.2f} s, affix index {index_time:.2f} s, same result: {result == reference}")
+
+
+# classify_token as it was before the single regex
+def classify_token_reference(word: str, possible_word_regex: str) -> tuple[int, str, str, bool]:
+    if len(word) >= 48:
+        return TOKEN_BREAK, word, word, False
+    if word.isspace():
+        return TOKEN_SPACE, word, word, False
+    if word.isnumeric():
+        return TOKEN_BREAK, word, word, False
+    if "--" in word:
+        return TOKEN_INVALID, word, word, False
+    if not regex.search(r"\p{L}", word):
+        return TOKEN_NOT_WORD, word, word, False
+    word = word.replace('’', '\'')
+    re_find = regex.findall(possible_word_regex, word)
+    return TOKEN_WORD, re_find[0], word, len(re_find) > 1
+
+
+# tokens per second for classifying all tokens of a sentence file
+# note that in add_line only tokens that are not already known words are classified
+def benchmark_classify_token(filename: str = "../README.md", repeat: int = 5):
+    with open(filename) as f:
+        tokens = [token for line in f for token in line.split()]
+    classify_token("", Wordlist.possible_word_regex)  # compile the regex before timing
+
+    t = time.time()
+    for _ in range(repeat):
+        reference = [classify_token_reference(token, Wordlist.possible_word_regex) for token in tokens]
+    reference_time = time.time() - t
+
+    t = time.time()
+    for _ in range(repeat):
+        result = [classify_token(token, Wordlist.possible_word_regex) for token in tokens]
+    single_regex_time = time.time() - t
+
+    count = len(tokens) * repeat
+    print(f"classify_token {filename}: {len(tokens)} tokens, reference {count / reference_time:.0f} tokens/s, "
+          f"single regex {count / single_regex_time:.0f} tokens/s, same result: {result == reference}")
+
+
+# compare write_binary_dict with dicttool on the word lists
+# without java, the result is compared with the dictionaries in ../dictionaries (compiled from the word lists)
+# this only prints the results, generate_source_entries.py --check fails if a dictionary is different
+def benchmark_compile(wordlists: str = "../wordlists", dictionaries: str = "../dictionaries"):
+    dicttool = "../dicttool_aosp.jar"
+    java = shutil.which("java") is not None and os.path.isfile(dicttool)
+    different = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for filename in sorted(os.listdir(wordlists)):
+            if ".combined" not in filename:
+                continue
+            name = filename[:filename.index(".combined")]
+            source = os.path.join(wordlists, filename)
+            reference_file = os.path.join(dictionaries, f"{name.lower()}.dict")
+            reference_time = None
+            if java:
+                combined = os.path.join(tmpdir, f"{name}.combined")
+                shutil.copyfile(source, combined)  # dicttool also reads .gz
+                reference_file = os.path.join(tmpdir, f"{name}.dict")
+                t = time.time()
+                subprocess.run(["java", "-jar", dicttool, "makedict", "-s", combined, "-d", reference_file],
+                               stdout=subprocess.DEVNULL)
+                reference_time = time.time() - t
+            elif not os.path.isfile(reference_file):
+                continue
+
+            result_file = os.path.join(tmpdir, f"{name}.python.dict")
+            t = time.time()
+            entries = read_entries(source, header=True)
+            header = next(entries)
+            write_binary_dict(result_file, header, entries)
+            python_time = time.time() - t
+
+            with open(reference_file, "rb") as f:
+                reference = f.read()
+            with open(result_file, "rb") as f:
+                result = f.read()
+            reference_text = f"dicttool {reference_time:.2f} s" if reference_time is not None else "no java"
+            print(f"compile {name}: {len(result)} bytes, {reference_text}, python {python_time:.2f} s, "
+                  f"same result: {result == reference}")
+            if result != reference:
+                different.append(name)
+    print(f"different result for {len(different)} word lists: {', '.join(different)}")
+
+
+# everything add_sentence_file changes in a Wordlist, for comparing results
+# bigram pairs are ordered by word id, so this includes the order in which the words were added to bigram_counts
+#  next_counts also includes the order of next words with the same count
+def wordlist_result(w: Wordlist) -> tuple:
+    return (list(w.word_infos.items()), [pair for pair in w.bigram_counts.pairs()],
+            [w.bigram_counts.next_counts(word) for word in w.bigram_counts.words], w.invalid_words, w.not_words,
+            w.weird_things, w.count, w.count_valid, w.ignore_word_count)
+
+
+# add_sentence_file with different numbers of processes, compared to processes=1
+# use a real sentence file (e.g. from wortschatz.uni-leipzig.de), as the speedup depends on how many dictionary
+#  lookups are needed (and on the number of free CPU cores)
+# raises an AssertionError if the result is not the same as with processes=1
+def benchmark_add_sentence_file(filename: str, loc: str = "en_US", processes=(1, 2, 4)):
+    dictionary = find_dict(loc)
+    reference = None
+    reference_time = None
+    for p in processes:
+        w = Wordlist(dictionary)
+        t = time.time()
+        w.add_sentence_file(filename, processes=p)
+        total_time = time.time() - t
+        result = wordlist_result(w)
+        if reference is None:
+            reference = result
+            reference_time = total_time
+        print(f"add_sentence_file {filename} {loc}: {p} processes {total_time:.2f} s, {w.count} words, "
+              f"speedup {reference_time / total_time:.2f}")
+        assert result == reference, f"add_sentence_file with {p} processes: result is not the same"
+
+
+if __name__ == "__main__":
+    benchmark_unmunch()
+    benchmark_classify_token()
+    benchmark_compile()
@@ -0,0 +1,264 @@
+#!/bin/python
+import heapq
+import zlib
+from array import array
+from bisect import bisect_left
+
+# todo:
+#  counts are limited to 2^32 - 1, should be fine for any corpus
+
+
+# counts of (previous word, next word) pairs
+# words get an id when first added, and the pair is stored as a single 64 bit key (previous_id << 32 | next_id)
+# new counts are collected in a dict, which is flushed to a sorted run of keys, counts and first-seen numbers
+#  (arrays, 20 bytes per pair) when it reaches staging_size entries
+# the first-seen number orders the pairs by first occurrence (the order of the staging dict, continued over flushes),
+#  so next words with the same count are in the order they first followed the word, like in a dict of next words
+# runs are merged when a run is not smaller than the previous one, so there are only few runs (like a binary counter)
+# this needs much less memory than a dict of next words for each word, especially on large corpora
+class BigramCounts:
+    def __init__(self, staging_size: int = 1 << 18):
+        self.staging_size = staging_size
+        self.ids: dict[str, int] = {}
+        self.words: list[str] = []
+        self.staging: dict[int, int] = {}
+        # sorted keys, counts and first-seen numbers, oldest and largest first
+        self.runs: list[tuple[array, array, array]] = []
+        # first-seen number of the first pair in staging
+        self.first_seen = 0
+
+    def word_id(self, word: str) -> int:
+        word_id = self.ids.get(word)
+        if word_id is None:
+            word_id = len(self.words)
+            self.ids[word] = word_id
+            self.words.append(word)
+        return word_id
+
+    def add(self, previous_word: str, word: str, count: int = 1):
+        # this is called for almost every word in a corpus, so avoid calling word_id if possible
+        previous_id = self.ids.get(previous_word)
+        if previous_id is None:
+            previous_id = self.word_id(previous_word)
+        next_id = self.ids.get(word)
+        if next_id is None:
+            next_id = self.word_id(word)
+        key = previous_id << 32 | next_id
+        staging = self.staging
+        staging[key] = staging.get(key, 0) + count
+        if len(staging) >= self.staging_size:
+            self._flush()
+
+    # list of (next word, count) for word, ordered by the first occurrence of the pair
+    def next_counts(self, word: str) -> list[tuple[str, int]]:
+        word_id = self.ids.get(word)
+        if word_id is None:
+            return []
+        self.compact()
+        if len(self.runs) == 0:
+            return []
+        (keys, counts, first_seen) = self.runs[0]
+        start = bisect_left(keys, word_id << 32)
+        end = bisect_left(keys, (word_id + 1) << 32, start)
+        return [(self.words[keys[i] & 0xFFFFFFFF], counts[i])
+                for i in sorted(range(start, end), key=first_seen.__getitem__)]
+
+    # like next_counts, with the count as lowest and highest possible count (counts are exact here, see BigramSketch)
+    def next_count_bounds(self, word: str) -> list[tuple[str, int, int]]:
+        return [(next_word, count, count) for (next_word, count) in self.next_counts(word)]
+
+    # (previous word, next word, count, error) for all pairs, error is always 0 here (see BigramSketch)
+    def pairs(self):
+        words = self.words
+        for (key, count) in self.items():
+            yield words[key >> 32], words[key & 0xFFFFFFFF], count, 0
+
+    # (key, count) for all pairs, ordered by key
+    def items(self):
+        self.compact()
+        if len(self.runs) == 0:
+            return iter(())
+        return zip(self.runs[0][0], self.runs[0][1])
+
+    def __len__(self) -> int:
+        self.compact()
+        return len(self.runs[0][0]) if len(self.runs) > 0 else 0
+
+    # merges everything into a single run
+    def compact(self):
+        if len(self.staging) > 0:
+            self._flush()
+        while len(self.runs) > 1:
+            newer = self.runs.pop()
+            self.runs.append(merge_runs(self.runs.pop(), newer))
+
+    def _flush(self):
+        staging = self.staging
+        first = self.first_seen
+        items = sorted(zip(staging, staging.values(), range(first, first + len(staging))))
+        self.runs.append((array("Q", [key for (key, _, _) in items]), array("I", [count for (_, count, _) in items]),
+                          array("Q", [seen for (_, _, seen) in items])))
+        self.first_seen += len(staging)
+        self.staging = {}
+        while len(self.runs) > 1 and len(self.runs[-2][0]) <= len(self.runs[-1][0]):
+            newer = self.runs.pop()
+            self.runs.append(merge_runs(self.runs.pop(), newer))
+
+
+# merges two sorted runs of (keys, counts, first-seen numbers), adding the counts and keeping the lower first-seen
+#  number for keys in both runs
+def merge_runs(run1: tuple[array, array, array], run2: tuple[array, array, array]) -> tuple[array, array, array]:
+    keys = array("Q")
+    counts = array("I")
+    first_seen = array("Q")
+    last_key = -1
+    for (key, count, seen) in heapq.merge(zip(*run1), zip(*run2)):
+        if key == last_key:
+            counts[-1] += count
+            if seen < first_seen[-1]:
+                first_seen[-1] = seen
+        else:
+            keys.append(key)
+            counts.append(count)
+            first_seen.append(seen)
+            last_key = key
+    return keys, counts, first_seen
+
+
+# approximate BigramCounts for huge corpora, with fixed memory for next words of each word
+# for each previous word, only the capacity most frequent next words are counted ("space saving")
+#  the other pairs are counted in a count-min sketch of depth rows with width counters (conservative update)
+#  a pair is only counted separately once the sketch count reaches min_count, so the many pairs occurring once
+#   don't replace actual frequent next words (note that create_wordlist_combined ignores pairs occurring once)
+#  the sketch count when a pair starts being counted separately is kept as error, the actual count is at least the
+#   separate count, and at most count + error (see next_count_bounds)
+#  if the counts of a word are full, a new pair replaces the pair with the lowest count if its sketch count is higher,
+#   and the sketch count of the replaced pair is raised to count + error
+# for each word, every next word occurring more often than (number of bigrams of the word) / capacity is counted
+# memory is 4 * width * depth bytes for the sketch, plus the counts (up to capacity per word, and only for words
+#  followed by the same word more than once)
+#  ids, words and hashes are not bounded: they contain every distinct word of any pair, so they grow with the
+#  vocabulary of the corpus (like word_infos of the Wordlist), but not with the number of distinct pairs
+class BigramSketch:
+    def __init__(self, capacity: int = 8, width: int = 1 << 20, depth: int = 4, min_count: int = 2):
+        if width & (width - 1) != 0:
+            raise ValueError(f"width must be a power of 2, not {width}")
+        if depth > len(SKETCH_MULTIPLIERS):
+            raise ValueError(f"depth must be at most {len(SKETCH_MULTIPLIERS)}")
+        self.capacity = capacity
+        self.width = width
+        self.depth = depth
+        self.min_count = min_count
+        self.ids: dict[str, int] = {}
+        self.words: list[str] = []
+        # crc32 of each word, so it's not calculated again for each pair
+        self.hashes = array("I")
+        self.table = array("I", bytes(4 * width * depth))
+        self._shift = 64 - width.bit_length() + 1
+        # next word id -> count for each previous word id
+        self.counts: dict[int, dict[int, int]] = {}
+        # sketch count when counting started, by previous_id << 32 | next_id (only if not 0)
+        self.errors: dict[int, int] = {}
+
+    def word_id(self, word: str) -> int:
+        word_id = self.ids.get(word)
+        if word_id is None:
+            word_id = len(self.words)
+            self.ids[word] = word_id
+            self.words.append(word)
+            self.hashes.append(zlib.crc32(word.encode("utf-8")))
+        return word_id
+
+    def add(self, previous_word: str, word: str, count: int = 1):
+        previous_id = self.ids.get(previous_word)
+        if previous_id is None:
+            previous_id = self.word_id(previous_word)
+        next_id = self.ids.get(word)
+        if next_id is None:
+            next_id = self.word_id(word)
+        self._add(previous_id, next_id, count)
+
+    def _add(self, previous_id: int, next_id: int, count: int):
+        counts = self.counts.get(previous_id)
+        if counts is not None and next_id in counts:
+            counts[next_id] += count
+            return
+        # the sketch only counts the pair if it's not counted separately now
+        indexes = self._sketch_indexes(previous_id, next_id)
+        estimate = min(self.table[i] for i in indexes) + count
+        if estimate < self.min_count:
+            self._sketch_raise(indexes, estimate)
+            return
+        if counts is None:
+            counts = {}
+            self.counts[previous_id] = counts
+        elif len(counts) >= self.capacity:
+            errors = self.errors
+            lowest_id = min(counts, key=lambda i: counts[i] + errors.get(previous_id << 32 | i, 0))
+            lowest_count = counts[lowest_id] + errors.get(previous_id << 32 | lowest_id, 0)
+            if estimate <= lowest_count:
+                self._sketch_raise(indexes, estimate)
+                return
+            del counts[lowest_id]
+            errors.pop(previous_id << 32 | lowest_id, None)
+            self._sketch_raise(self._sketch_indexes(previous_id, lowest_id), lowest_count)
+        counts[next_id] = count
+        if estimate > count:
+            self.errors[previous_id << 32 | next_id] = estimate - count
+
+    # sets the sketch counters to at least count (conservative update)
+    def _sketch_raise(self, indexes: list[int], count: int):
+        table = self.table
+        for i in indexes:
+            if table[i] < count:
+                table[i] = count
+
+    def _sketch_indexes(self, previous_id: int, next_id: int) -> list[int]:
+        key = self.hashes[previous_id] << 32 | self.hashes[next_id]
+        shift = self._shift
+        width = self.width
+        return [row * width + (((key * multiplier) & 0xFFFFFFFFFFFFFFFF) >> shift)
+                for (row, multiplier) in enumerate(SKETCH_MULTIPLIERS[:self.depth])]
+
+    # list of (next word, count) for word, ordered by next word id (i.e. the order the next words were first seen in
+    #  any pair, unlike BigramCounts this does not keep the first occurrence of each pair)
+    # counts are the highest possible counts
+    def next_counts(self, word: str) -> list[tuple[str, int]]:
+        return [(next_word, count) for (next_word, _, count) in self.next_count_bounds(word)]
+
+    # list of (next word, lowest possible count, highest possible count) for word, ordered like next_counts
+    # if the lowest count of a pair is at least the highest count of another pair, it's certainly more frequent
+    def next_count_bounds(self, word: str) -> list[tuple[str, int, int]]:
+        word_id = self.ids.get(word)
+        counts = self.counts.get(word_id) if word_id is not None else None
+        if counts is None:
+            return []
+        errors = self.errors
+        return [(self.words[next_id], count, count + errors.get(word_id << 32 | next_id, 0))
+                for (next_id, count) in sorted(counts.items())]
+
+    # (previous word, next word, count, error) for all counted pairs
+    def pairs(self):
+        words = self.words
+        for (previous_id, counts) in self.counts.items():
+            for (next_id, count) in counts.items():
+                yield words[previous_id], words[next_id], count, self.errors.get(previous_id << 32 | next_id, 0)
+
+    def __len__(self) -> int:
+        return sum(len(counts) for counts in self.counts.values())
+
+    def compact(self):
+        pass
+
+
+# odd 64 bit constants for multiplicative hashing in BigramSketch, one per row
+SKETCH_MULTIPLIERS = (
+    0x9E3779B97F4A7C15,
+    0xC2B2AE3D27D4EB4F,
+    0x165667B19E3779F9,
+    0xD6E8FEB86659FD93,
+    0xFF51AFD7ED558CCD,
+    0xC4CEB9FE1A85EC53,
+    0x94D049BB133111EB,
+    0xBF58476D1CE4E5B9,
+)
@@ -0,0 +1,731 @@
+#!/bin/python
+import mmap
+import struct
+from wordlist_combined import DictionaryHeader, WordAttributes, WordlistCombined
+
+# reader and writer for binary dictionaries (.dict) in AOSP format version 2 (202), as created by dicttool_aosp.jar
+#  makedict
+# the file is memory-mapped by the reader, and the trie is only read where needed, so looking up a word is fast even
+#  for large files
+# the writer creates the same file as dicttool would create from the .combined file of the word list (see
+#  write_binary_dict), without java
+# layout (integers are big endian):
+#  header: magic, format version (u16), options (u16), header size (u32), then attributes as key and value strings
+#  PtNode arrays, starting with the root array directly after the header
+#   array: number of PtNodes (1 byte if < 0x80, otherwise 2 bytes with 0x8000 set), followed by the PtNodes
+#   PtNode:
+#    flags (see FLAG_*)
+#    characters: one, or several followed by CHARACTERS_TERMINATOR if FLAG_HAS_MULTIPLE_CHARS
+#     characters 0x20 - 0xFF are stored as 1 byte, others as 3 bytes
+#    frequency (1 byte, only if FLAG_IS_TERMINAL)
+#    children address (0 - 3 bytes, see MASK_CHILDREN_ADDRESS_TYPE), relative to the position of the address
+#    shortcuts (if FLAG_HAS_SHORTCUT_TARGETS): size of the list (u16, including the size), and for each shortcut
+#     flags (has next and frequency) and the shortcut string followed by CHARACTERS_TERMINATOR
+#    bigrams (if FLAG_HAS_BIGRAMS): for each bigram flags (has next, offset sign, offset size and frequency) and the
+#     offset of the next word PtNode, relative to the position after the flags
+# bigram frequencies are stored as one of 16 steps between the frequency of the next word and 255
+
+MAGIC = 0x9BC13AFE
+FORMAT_VERSION = 202
+# increase when BinaryDictionaryWriter creates different files, so dictionaries in build manifests are compiled again
+WRITER_VERSION = 2
+HEADER = struct.Struct(">IHHI")
+
+MASK_CHILDREN_ADDRESS_TYPE = 0xC0
+FLAG_HAS_MULTIPLE_CHARS = 0x20
+FLAG_IS_TERMINAL = 0x10
+FLAG_HAS_SHORTCUT_TARGETS = 0x08
+FLAG_HAS_BIGRAMS = 0x04
+FLAG_IS_NOT_A_WORD = 0x02
+FLAG_IS_POSSIBLY_OFFENSIVE = 0x01
+
+FLAG_ATTRIBUTE_HAS_NEXT = 0x80
+FLAG_BIGRAM_OFFSET_NEGATIVE = 0x40
+MASK_BIGRAM_ADDRESS_TYPE = 0x30
+MASK_ATTRIBUTE_FREQUENCY = 0x0F
+
+CHARACTERS_TERMINATOR = 0x1F
+MAX_TERMINAL_FREQUENCY = 255
+MAX_WORD_LENGTH = 48  # dicttool ignores words with at least this many characters
+# dicttool finds word lines with "word=.*", and in java "." doesn't match these, so words containing them are ignored
+JAVA_LINE_TERMINATORS = frozenset("\n\r\u0085\u2028\u2029")
+MAX_PTNODES_IN_ARRAY = 0x7FFF
+MAX_BIGRAM_FREQUENCY = 15
+SHORTCUT_WHITELIST_FREQUENCY = 15
+
+
+class BinaryDictionary:
+    def __init__(self, filename: str):
+        self.filename = filename
+        with open(filename, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.data) < HEADER.size:
+            raise ValueError(f"{filename} is not a binary dictionary")
+        (magic, self.version, self.options, header_size) = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{filename} is not a binary dictionary")
+        if self.version != FORMAT_VERSION:
+            raise ValueError(f"{filename} has unsupported format version {self.version}")
+        # header attributes as in the file, e.g. dictionary, locale, description, date and version
+        self.attributes: dict[str, str] = {}
+        position = HEADER.size
+        while position < header_size:
+            (key, position) = read_string(self.data, position)
+            (value, position) = read_string(self.data, position)
+            self.attributes[key] = value
+        if "codePointTable" in self.attributes:
+            raise ValueError(f"{filename} uses a code point table, which is not supported")
+        self.header = header_from_attributes(self.attributes)
+        self.root = header_size
+
+    def close(self):
+        self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __contains__(self, word: str) -> bool:
+        return self._find(word) is not None
+
+    # frequency of the word, or None if the word is not in the dictionary
+    def frequency(self, word: str) -> int | None:
+        position = self._find(word)
+        if position is None:
+            return None
+        return self._node(position)[2]
+
+    # WordAttributes of the word (with shortcuts and bigrams), or None if the word is not in the dictionary
+    def get(self, word: str) -> WordAttributes | None:
+        position = self._find(word)
+        if position is None:
+            return None
+        return self._attributes(self._node(position))
+
+    # yields (word, frequency) for all words, in depth-first order of the trie
+    def words(self):
+        for (word, node) in self._terminals():
+            yield word, node[2]
+
+    # yields (word, WordAttributes) for all words, in the same order as words()
+    # bigram targets are found by searching the trie, so this is slower than words()
+    def __iter__(self):
+        targets = {}  # bigram target words by position, the same few words are targets of many bigrams
+        for (word, node) in self._terminals():
+            yield word, self._attributes(node, targets)
+
+    # word of the terminal PtNode at position, as used for bigram targets
+    # the trie has no parent addresses, but arrays are stored in depth-first order, so the PtNode is in the subtree
+    #  of the last PtNode with children address before position
+    def word_at(self, position: int) -> str | None:
+        prefix = ""
+        array = self.root
+        while True:
+            (count, node_position) = read_count(self.data, array)
+            candidate = None
+            for _ in range(count):
+                node = self._node(node_position)
+                if node_position == position:
+                    return prefix + node[1]
+                if node[3] is not None:
+                    if node[3] <= position:
+                        candidate = node
+                    elif candidate is not None:
+                        break
+                node_position = node[5]
+            if candidate is None:
+                return None
+            prefix += candidate[1]
+            array = candidate[3]
+
+    # position of the terminal PtNode for word, or None
+    def _find(self, word: str) -> int | None:
+        if len(word) == 0:
+            return None
+        array = self.root
+        index = 0
+        while True:
+            (count, position) = read_count(self.data, array)
+            for _ in range(count):
+                node = self._node(position)
+                characters = node[1]
+                if characters[0] == word[index]:
+                    if not word.startswith(characters, index):
+                        return None
+                    index += len(characters)
+                    if index == len(word):
+                        return position if node[0] & FLAG_IS_TERMINAL else None
+                    if node[3] is None:
+                        return None
+                    array = node[3]
+                    break
+                position = node[5]
+            else:
+                return None
+
+    # yields (word, node) for terminal PtNodes, depth-first
+    def _terminals(self):
+        (count, position) = read_count(self.data, self.root)
+        # remaining PtNodes of the arrays on the path: (position, count, prefix)
+        stack = [(position, count, "")]
+        while len(stack) > 0:
+            (position, count, prefix) = stack.pop()
+            if count == 0:
+                continue
+            node = self._node(position)
+            stack.append((node[5], count - 1, prefix))
+            word = prefix + node[1]
+            if node[0] & FLAG_IS_TERMINAL:
+                yield word, node
+            if node[3] is not None:
+                (child_count, child_position) = read_count(self.data, node[3])
+                stack.append((child_position, child_count, word))
+
+    # flags, characters, frequency, children address, position of shortcuts / bigrams, and position of the next PtNode
+    def _node(self, position: int) -> tuple[int, str, int | None, int | None, int, int]:
+        data = self.data
+        flags = data[position]
+        position += 1
+        if flags & FLAG_HAS_MULTIPLE_CHARS:
+            (characters, position) = read_string(data, position)
+        else:
+            (character, position) = read_character(data, position)
+            characters = chr(character)
+        frequency = None
+        if flags & FLAG_IS_TERMINAL:
+            frequency = data[position]
+            position += 1
+        children = None
+        address_size = (flags & MASK_CHILDREN_ADDRESS_TYPE) >> 6
+        if address_size > 0:
+            children = position + int.from_bytes(data[position:position + address_size], "big")
+            position += address_size
+        attributes_position = position
+        if flags & FLAG_HAS_SHORTCUT_TARGETS:
+            position += struct.unpack_from(">H", data, position)[0]
+        if flags & FLAG_HAS_BIGRAMS:
+            while True:
+                bigram_flags = data[position]
+                position += 1 + ((bigram_flags & MASK_BIGRAM_ADDRESS_TYPE) >> 4)
+                if not bigram_flags & FLAG_ATTRIBUTE_HAS_NEXT:
+                    break
+        return flags, characters, frequency, children, attributes_position, position
+
+    def _attributes(self, node: tuple, targets: dict | None = None) -> WordAttributes:
+        (flags, _, frequency, _, position, _) = node
+        data = self.data
+        attributes = WordAttributes()
+        attributes.f = frequency
+        attributes.possibly_offensive = bool(flags & FLAG_IS_POSSIBLY_OFFENSIVE)
+        attributes.not_a_word = bool(flags & FLAG_IS_NOT_A_WORD)
+        if flags & FLAG_HAS_SHORTCUT_TARGETS:
+            shortcuts = {}
+            position += 2
+            while True:
+                shortcut_flags = data[position]
+                (shortcut, position) = read_string(data, position + 1)
+                shortcut_frequency = shortcut_flags & MASK_ATTRIBUTE_FREQUENCY
+                if shortcut_frequency == SHORTCUT_WHITELIST_FREQUENCY:
+                    shortcuts[shortcut] = "whitelist"
+                else:
+                    shortcuts[shortcut] = str(shortcut_frequency)
+                if not shortcut_flags & FLAG_ATTRIBUTE_HAS_NEXT:
+                    break
+            attributes.shortcuts = shortcuts
+        if flags & FLAG_HAS_BIGRAMS:
+            bigrams = {}
+            while True:
+                bigram_flags = data[position]
+                position += 1
+                address_size = (bigram_flags & MASK_BIGRAM_ADDRESS_TYPE) >> 4
+                offset = int.from_bytes(data[position:position + address_size], "big")
+                target = position - offset if bigram_flags & FLAG_BIGRAM_OFFSET_NEGATIVE else position + offset
+                position += address_size
+                target_word = targets.get(target) if targets is not None else None
+                if target_word is None:
+                    target_word = (self.word_at(target), self._node(target)[2])
+                    if targets is not None:
+                        targets[target] = target_word
+                (word, frequency) = target_word
+                if word is not None:
+                    bigrams[word] = bigram_frequency(frequency, bigram_flags & MASK_ATTRIBUTE_FREQUENCY)
+                if not bigram_flags & FLAG_ATTRIBUTE_HAS_NEXT:
+                    break
+            attributes.bigrams = bigrams
+        return attributes
+
+
+# DictionaryHeader from binary dictionary header attributes, None if locale or dictionary type are missing
+def header_from_attributes(attributes: dict[str, str]) -> DictionaryHeader | None:
+    locale = attributes.get("locale")
+    dictionary = attributes.get("dictionary")
+    if locale is None or dictionary is None:
+        return None
+    dict_type = dictionary.split(":")[0]
+    version = attributes.get("version", "")
+    date = attributes.get("date", "")
+    other = {name: value for (name, value) in attributes.items() if name not in DictionaryHeader.ATTRIBUTES}
+    return DictionaryHeader(locale, dict_type, attributes.get("description", " "),
+                            int(version) if version.isdigit() else 18,
+                            int(date) if date.isdigit() else 0, other)
+
+
+# approximate bigram frequency from the stored step, same as dicttool (with 32 bit float)
+def bigram_frequency(next_word_frequency: int, step: int) -> int:
+    step_size = float32((MAX_TERMINAL_FREQUENCY - next_word_frequency) / float32(1.5 + MAX_BIGRAM_FREQUENCY))
+    return int(float32(next_word_frequency + float32(step_size * (step + 1))))
+
+
+def float32(value: float) -> float:
+    return struct.unpack("f", struct.pack("f", value))[0]
+
+
+def read_count(data, position: int) -> tuple[int, int]:
+    count = data[position]
+    if count & 0x80:
+        return (count & 0x7F) << 8 | data[position + 1], position + 2
+    return count, position + 1
+
+
+def read_character(data, position: int) -> tuple[int, int]:
+    character = data[position]
+    if 0x20 <= character <= 0xFF:
+        return character, position + 1
+    return character << 16 | data[position + 1] << 8 | data[position + 2], position + 3
+
+
+# string terminated by CHARACTERS_TERMINATOR
+def read_string(data, position: int) -> tuple[str, int]:
+    characters = []
+    while data[position] != CHARACTERS_TERMINATOR:
+        (character, position) = read_character(data, position)
+        characters.append(chr(character))
+    return "".join(characters), position + 1
+
+
+# WordlistCombined with all words of a binary dictionary
+# note that bigram frequencies are approximate, and words are not in the original order
+def read_binary_dict(filename: str) -> WordlistCombined:
+    with BinaryDictionary(filename) as dictionary:
+        return WordlistCombined(header=dictionary.header, words=dict(dictionary))
+
+
+# writes a binary dictionary with the (word, WordAttributes) entries, the file is the same as dicttool makedict creates
+#  from a .combined file with the entries in this order (see BinaryDictionaryWriter for why the order matters)
+# entries can be a generator, e.g. from read_entries, so a word list file can be compiled without loading it completely
+def write_binary_dict(filename: str, header: DictionaryHeader, entries):
+    writer = BinaryDictionaryWriter(header)
+    for (word, attributes) in entries:
+        writer.add(word, attributes)
+    writer.write(filename)
+
+
+# builds the trie like dicttool (FusionDictionary) and writes it in the same layout, so the files are identical
+# dicttool adds words in the order of the .combined file, which matters in a few cases:
+#  a bigram adds its next word with f 0 if it's not in the dictionary (yet), the word keeps the highest f it's added with
+#  if the word is already a PtNode in the root array (also if only as prefix of other words), not_a_word is only kept
+#   if it's set for both, and possibly_offensive if it's set for any, otherwise the flags of the last addition are used
+# like dicttool, words with MAX_WORD_LENGTH or more characters or with JAVA_LINE_TERMINATORS are ignored, and unknown
+#  attributes are not written
+# known difference: dicttool ignores attributes after a space (e.g. f in "word=a, f=5", so the word gets f 0), but
+#  read_entries reads them, and they are written (the word lists in this repository don't have such spaces, and their
+#  dictionaries are checked with generate_source_entries.py --check)
+class BinaryDictionaryWriter:
+    def __init__(self, header: DictionaryHeader):
+        self.header = header
+        self.root: dict[str, _PtNode] = {}  # PtNodes by first character, arrays are sorted when writing
+        self.ignored_words = 0
+
+    # adds the word with f, flags, shortcuts and bigrams (in the order write_entry writes them to a .combined file)
+    def add(self, word: str, attributes: WordAttributes):
+        if not JAVA_LINE_TERMINATORS.isdisjoint(word):
+            self.ignored_words += 1
+            return
+        shortcuts = [(shortcut, shortcut_frequency(f)) for (shortcut, f) in attributes.shortcut_items()]
+        if not self.add_word(word, attributes.f, shortcuts, attributes.not_a_word, attributes.possibly_offensive):
+            return
+        for (next_word, f) in sorted(attributes.bigram_items(), key=lambda item: item[1]):
+            self.add_bigram(word, next_word, f)
+
+    # FusionDictionary.add, returns False if the word is ignored
+    def add_word(self, word: str, f: int, shortcuts: list[tuple[str, int]] | None = None, not_a_word: bool = False,
+                 possibly_offensive: bool = False) -> bool:
+        if len(word) == 0 or len(word) >= MAX_WORD_LENGTH:
+            self.ignored_words += 1
+            return False
+        if not shortcuts:
+            shortcuts = None
+        array = self.root
+        index = 0
+        node = array.get(word[0])
+        difference = 0
+        while node is not None:
+            difference = _compare(node.chars, word, index)
+            if difference != 0 and difference < len(node.chars):
+                break
+            if node.children is None:
+                break
+            index += len(node.chars)
+            if index >= len(word):
+                break
+            array = node.children
+            node = array.get(word[index])
+
+        if node is None:
+            array[word[index]] = _PtNode(word[index:], f, shortcuts, not_a_word, possibly_offensive)
+        elif difference == len(node.chars):
+            if index + difference >= len(word):
+                node.update(f, shortcuts, not_a_word, possibly_offensive)
+            else:
+                # the word continues after node, which has no children
+                tail = word[index + difference:]
+                node.children = {tail[0]: _PtNode(tail, f, shortcuts, not_a_word, possibly_offensive)}
+        elif difference == 0:
+            # the word is node
+            node.update(f, shortcuts, node.not_a_word and not_a_word, node.possibly_offensive or possibly_offensive)
+        else:
+            # split node after the common part
+            old = _PtNode(node.chars[difference:], node.f, node.shortcuts, node.not_a_word, node.possibly_offensive)
+            old.bigrams = node.bigrams
+            old.children = node.children
+            node.chars = node.chars[:difference]
+            node.children = {old.chars[0]: old}
+            node.bigrams = None
+            if index + difference >= len(word):
+                (node.f, node.shortcuts, node.not_a_word, node.possibly_offensive) = \
+                    (f, shortcuts, not_a_word, possibly_offensive)
+            else:
+                (node.f, node.shortcuts, node.not_a_word, node.possibly_offensive) = (None, None, False, False)
+                tail = word[index + difference:]
+                node.children[tail[0]] = _PtNode(tail, f, shortcuts, not_a_word, possibly_offensive)
+        return True
+
+    # FusionDictionary.setBigram, the next word is added with f 0 if it's not in the dictionary
+    # a bigram is ignored if one of the words is ignored
+    def add_bigram(self, word: str, next_word: str, f: int):
+        node = self.find(word)
+        if node is None:
+            return
+        if self.find(next_word) is None:
+            if not self.add_word(next_word, 0):
+                return
+            # the PtNode of word may have been split
+            node = self.find(word)
+        if node.bigrams is None:
+            node.bigrams = {}
+        node.bigrams[next_word] = f
+
+    # terminal PtNode of word, or None
+    def find(self, word: str):
+        array = self.root
+        index = 0
+        while True:
+            node = array.get(word[index]) if index < len(word) else None
+            if node is None or not word.startswith(node.chars, index):
+                return None
+            index += len(node.chars)
+            if index == len(word):
+                return node if node.f is not None else None
+            array = node.children
+            if array is None:
+                return None
+
+    def write(self, filename: str):
+        if self.ignored_words > 0:
+            print(f"Warning: ignored {self.ignored_words} words that are empty, have {MAX_WORD_LENGTH} or more "
+                  f"characters, or contain line breaks")
+        arrays = self._flatten()
+        _compute_addresses(arrays)
+        last = arrays[-1]
+        data = bytearray(last.address + last.size)
+        for array in arrays:
+            position = array.address
+            count = len(array.nodes)
+            if count < 0x80:
+                data[position] = count
+                position += 1
+            else:
+                data[position:position + 2] = (count | 0x8000).to_bytes(2, "big")
+                position += 2
+            for node in array.nodes:
+                position = node.write(data, position)
+        with open(filename, "wb") as f:
+            f.write(header_bytes(self.header))
+            f.write(data)
+
+    # list of _PtNodeArrays in the order they are written: depth-first, each array before the arrays of its PtNodes
+    def _flatten(self) -> list:
+        arrays = []
+        stack = [_PtNodeArray(self.root)]
+        while len(stack) > 0:
+            array = stack.pop()
+            arrays.append(array)
+            for node in reversed(array.nodes):
+                node.prepare(self)
+                if node.children is not None:
+                    node.children_array = _PtNodeArray(node.children)
+                    stack.append(node.children_array)
+        return arrays
+
+
+class _PtNode:
+    __slots__ = ("chars", "f", "shortcuts", "bigrams", "not_a_word", "possibly_offensive", "children",
+                 # for writing
+                 "children_array", "header", "shortcut_bytes", "targets", "size", "address", "new_address")
+
+    def __init__(self, chars: str, f: int | None, shortcuts: list[tuple[str, int]] | None, not_a_word: bool,
+                 possibly_offensive: bool):
+        self.chars = chars
+        self.f = f  # None if not terminal
+        self.shortcuts = shortcuts
+        self.bigrams: dict[str, int] | None = None
+        self.not_a_word = not_a_word
+        self.possibly_offensive = possibly_offensive
+        self.children: dict[str, _PtNode] | None = None
+        self.children_array: _PtNodeArray | None = None
+
+    # PtNode.update: highest f, shortcuts are added or get the higher f
+    def update(self, f: int, shortcuts: list[tuple[str, int]] | None, not_a_word: bool, possibly_offensive: bool):
+        if self.f is None or f >= self.f:
+            self.f = f
+        if shortcuts is not None:
+            if self.shortcuts is None:
+                self.shortcuts = shortcuts
+            else:
+                existing = [shortcut for (shortcut, _) in self.shortcuts]
+                for (shortcut, shortcut_f) in shortcuts:
+                    if shortcut in existing:
+                        i = existing.index(shortcut)
+                        self.shortcuts[i] = (shortcut, max(self.shortcuts[i][1], shortcut_f))
+                    else:
+                        existing.append(shortcut)
+                        self.shortcuts.append((shortcut, shortcut_f))
+        self.not_a_word = not_a_word
+        self.possibly_offensive = possibly_offensive
+
+    # parts that don't depend on addresses
+    def prepare(self, writer: BinaryDictionaryWriter):
+        if self.f is not None and not 0 <= self.f <= MAX_TERMINAL_FREQUENCY:
+            raise ValueError(f"frequency of a word must be 0 - {MAX_TERMINAL_FREQUENCY}, not {self.f}")
+        flags = FLAG_HAS_MULTIPLE_CHARS if len(self.chars) > 1 else 0
+        if self.f is not None:
+            flags |= FLAG_IS_TERMINAL
+        if self.shortcuts is not None:
+            flags |= FLAG_HAS_SHORTCUT_TARGETS
+        if self.bigrams is not None:
+            flags |= FLAG_HAS_BIGRAMS
+        if self.not_a_word:
+            flags |= FLAG_IS_NOT_A_WORD
+        if self.possibly_offensive:
+            flags |= FLAG_IS_POSSIBLY_OFFENSIVE
+        header = bytearray([flags])
+        header += encode_string(self.chars, len(self.chars) > 1)
+        if self.f is not None:
+            header.append(self.f)
+        self.header = bytes(header)
+        self.shortcut_bytes = b""
+        if self.shortcuts is not None:
+            shortcut_bytes = bytearray(2)
+            for (i, (shortcut, f)) in enumerate(self.shortcuts):
+                has_next = FLAG_ATTRIBUTE_HAS_NEXT if i + 1 < len(self.shortcuts) else 0
+                shortcut_bytes.append(has_next | f & MASK_ATTRIBUTE_FREQUENCY)
+                shortcut_bytes += encode_string(shortcut)
+            if len(shortcut_bytes) > 0xFFFF:
+                raise ValueError(f"too many shortcuts for {self.chars}")
+            shortcut_bytes[0:2] = len(shortcut_bytes).to_bytes(2, "big")
+            self.shortcut_bytes = bytes(shortcut_bytes)
+        # (next word PtNode, bigram f)
+        self.targets = []
+        if self.bigrams is not None:
+            self.targets = [(writer.find(next_word), f) for (next_word, f) in self.bigrams.items()]
+
+    # largest possible size, before addresses are known
+    def maximum_size(self) -> int:
+        return len(self.header) + 3 + len(self.shortcut_bytes) + 4 * len(self.targets)
+
+    # writes the PtNode at position, returns the position after it
+    def write(self, data: bytearray, position: int) -> int:
+        header = self.header
+        start = position
+        data[position:position + len(header)] = header
+        position += len(header)
+        if self.children_array is not None:
+            offset = self.children_array.address - position
+            address_size = address_byte_size(offset)
+            data[start] |= address_size << 6
+            data[position:position + address_size] = offset.to_bytes(address_size, "big")
+            position += address_size
+        data[position:position + len(self.shortcut_bytes)] = self.shortcut_bytes
+        position += len(self.shortcut_bytes)
+        for (i, (target, f)) in enumerate(self.targets):
+            offset = target.address - (position + 1)
+            address_size = address_byte_size(offset)
+            flags = FLAG_ATTRIBUTE_HAS_NEXT if i + 1 < len(self.targets) else 0
+            if offset < 0:
+                flags |= FLAG_BIGRAM_OFFSET_NEGATIVE
+            flags |= address_size << 4
+            # the bigram f can't be lower than the f of the next word (dicttool logs an error)
+            flags |= bigram_frequency_step(target.f, max(f, target.f)) & MASK_ATTRIBUTE_FREQUENCY
+            data[position] = flags
+            data[position + 1:position + 1 + address_size] = abs(offset).to_bytes(address_size, "big")
+            position += 1 + address_size
+        return position
+
+
+class _PtNodeArray:
+    __slots__ = ("nodes", "count_size", "size", "address", "new_address")
+
+    def __init__(self, nodes: dict[str, _PtNode]):
+        if len(nodes) > MAX_PTNODES_IN_ARRAY:
+            raise ValueError(f"too many PtNodes in an array: {len(nodes)}")
+        self.nodes = sorted(nodes.values(), key=lambda node: node.chars[0])
+        self.count_size = 1 if len(nodes) < 0x80 else 2
+
+
+# FusionDictionary.compareCharArrays: index of the first character where chars and word (from index) differ, or the
+#  length of chars if the word is longer, or 0 if they are equal (the first character is known to be the same)
+# like in dicttool, the length of the whole word is compared, so below the root array equal is the same as longer
+def _compare(chars: str, word: str, index: int) -> int:
+    if not word.startswith(chars, index):
+        for i in range(1, len(chars)):
+            if index + i >= len(word) or chars[i] != word[index + i]:
+                return i
+    return len(chars) if len(word) > len(chars) else 0
+
+
+# addresses are relative, so they depend on the sizes of the PtNodes in between, which depend on addresses
+# like dicttool, start with the largest possible sizes, and shrink them until nothing changes
+#  the result is not the smallest possible layout, but the same as dicttool creates
+def _compute_addresses(arrays: list[_PtNodeArray]):
+    address = 0
+    for array in arrays:
+        array.address = address
+        size = array.count_size
+        for node in array.nodes:
+            node.address = node.new_address = address + size
+            node.size = node.maximum_size()
+            size += node.size
+        array.size = size
+        address += size
+    for _ in range(24):
+        changed = False
+        address = 0
+        for array in arrays:
+            array.new_address = address
+            changed |= _compute_array_size(array)
+            address += array.size
+        for array in arrays:
+            array.address = array.new_address
+            for node in array.nodes:
+                node.address = node.new_address
+        if not changed:
+            return
+    raise ValueError("addresses of the binary dictionary don't converge")
+
+
+# updates the size of the array and its PtNodes from the current addresses, returns whether anything changed
+# targets before the current position already have their new address, others still the one from the last pass
+def _compute_array_size(array: _PtNodeArray) -> bool:
+    changed = False
+    size = array.count_size
+    for node in array.nodes:
+        node.new_address = array.new_address + size
+        if node.new_address != node.address:
+            changed = True
+        node_size = len(node.header)
+        children = node.children_array
+        if children is not None:
+            if children.address < array.address:
+                offset = children.new_address - (array.new_address + size + node_size)
+            else:
+                offset = children.address - (array.address + size + node_size)
+            node_size += address_byte_size(offset)
+        node_size += len(node.shortcut_bytes)
+        for (target, _) in node.targets:
+            position = size + node_size + 1
+            if target.address < array.address + position:
+                offset = target.new_address - (array.new_address + position)
+            else:
+                offset = target.address - (array.address + position)
+            node_size += address_byte_size(offset) + 1
+        node.size = node_size
+        size += node_size
+    if array.size != size:
+        array.size = size
+        changed = True
+    return changed
+
+
+def address_byte_size(offset: int) -> int:
+    offset = abs(offset)
+    if offset <= 0xFF:
+        return 1
+    if offset <= 0xFFFF:
+        return 2
+    return 3
+
+
+# bigram f is stored as one of 16 steps between the f of the next word and 255, same as dicttool (with 32 bit float)
+def bigram_frequency_step(next_word_frequency: int, frequency: int) -> int:
+    step_size = float32((MAX_TERMINAL_FREQUENCY - next_word_frequency) / float32(1.5 + MAX_BIGRAM_FREQUENCY))
+    first = float32(1 + next_word_frequency + float32(step_size / 2))
+    step = int(float32(float32(frequency - first) / step_size))
+    return step if step > 0 else 0
+
+
+# shortcut f as in .combined files ("whitelist" or a number, dicttool uses 0 if there is none) as int
+def shortcut_frequency(f: str | None) -> int:
+    if f is None:
+        return 0
+    if f == "whitelist":
+        return SHORTCUT_WHITELIST_FREQUENCY
+    return int(f)
+
+
+# characters 0x20 - 0xFF as 1 byte, others as 3 bytes, with CHARACTERS_TERMINATOR if terminated
+def encode_string(string: str, terminated: bool = True) -> bytes:
+    data = bytearray()
+    for character in string:
+        code = ord(character)
+        if 0x20 <= code <= 0xFF:
+            data.append(code)
+        else:
+            data += code.to_bytes(3, "big")
+    if terminated:
+        data.append(CHARACTERS_TERMINATOR)
+    return bytes(data)
+
+
+# header with the attributes of the DictionaryHeader, parsed from the header line as dicttool does
+def header_bytes(header: DictionaryHeader) -> bytes:
+    attributes = {}
+    for attribute in header.write().split(","):
+        split = attribute.split("=")
+        if len(split) != 2:
+            raise ValueError(f"invalid header attribute {attribute}")
+        attributes[split[0]] = split[1]
+    attributes.pop("options", None)
+    data = bytearray()
+    for key in java_hash_map_order(list(attributes)):
+        data += encode_string(key)
+        data += encode_string(attributes[key])
+    return HEADER.pack(MAGIC, FORMAT_VERSION, 0, HEADER.size + len(data)) + data
+
+
+# order of keys in a java HashMap (where dicttool keeps the attributes) with the keys inserted in this order
+def java_hash_map_order(keys: list[str]) -> list[str]:
+    capacity = 16
+    while len(keys) > capacity * 3 // 4:
+        capacity *= 2
+
+    # String.hashCode (of the UTF-16 code units), spread like in HashMap.hash
+    def bucket(key: str) -> int:
+        h = 0
+        encoded = key.encode("utf-16-be")
+        for unit in struct.unpack(f">{len(encoded) // 2}H", encoded):
+            h = (31 * h + unit) & 0xFFFFFFFF
+        return (h ^ h >> 16) & (capacity - 1)
+
+    return sorted(keys, key=bucket)
@@ -0,0 +1,141 @@
+#!/bin/python
+import hashlib
+import multiprocessing
+import os
+from itertools import chain
+from json_store import load_json_store, save_json_store
+from wordlist_combined import open_word_list, iter_entries
+
+# statistics of word lists (.combined, can be .gz), created in a single pass over each file
+# results are cached in a json file for each word list (path relative to the catalog file), with size, modification
+#  time and sha256 of the word list
+# the word list is only hashed if size or modification time changed, and only read if the hash changed
+# the catalog is a local cache (modification times differ for each checkout), it is in .gitignore and not committed
+
+CATALOG_FILE = os.path.join(os.path.dirname(__file__), "..", "word_list_catalog.json")
+# increase when word_list_stats changes, so cached stats are created again
+CATALOG_VERSION = 2
+
+
+# statistics for each of the word lists, in a dict with the filenames as keys
+# stats for word lists not in the catalog (or changed) are created in parallel, and stored in the catalog
+def word_list_catalog(filenames: list[str], processes: int | None = None,
+                      catalog_file: str | None = CATALOG_FILE) -> dict[str, dict]:
+    catalog = load_catalog(catalog_file) if catalog_file is not None else {}
+    catalog_dir = os.path.dirname(os.path.abspath(catalog_file)) if catalog_file is not None else ""
+    changed = False
+    result = {}
+    missing = []
+    for filename in filenames:
+        key = os.path.relpath(os.path.abspath(filename), catalog_dir) if catalog_file is not None else filename
+        entry = catalog.get(key)
+        stat = os.stat(filename)
+        state = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        if entry is not None and entry.get("version") == CATALOG_VERSION:
+            if all(entry.get(name) == value for (name, value) in state.items()):
+                result[filename] = entry["stats"]
+                continue
+            # changed modification time (e.g. after checkout), but maybe the same content
+            state["sha256"] = file_sha256(filename)
+            if entry.get("sha256") == state["sha256"]:
+                catalog[key] = {**entry, **state}
+                changed = True
+                result[filename] = entry["stats"]
+                continue
+        missing.append((filename, key, state))
+    if len(missing) > 0:
+        if processes is None:
+            processes = os.cpu_count() or 1
+        files = [filename for (filename, _, _) in missing]
+        if processes > 1 and len(missing) > 1:
+            context = multiprocessing.get_context("fork")
+            with context.Pool(min(processes, len(missing))) as pool:
+                stats = pool.map(word_list_stats, files, chunksize=1)
+        else:
+            stats = [word_list_stats(filename) for filename in files]
+        for ((filename, key, state), file_stats) in zip(missing, stats):
+            if "sha256" not in state:
+                state["sha256"] = file_sha256(filename)
+            catalog[key] = {"version": CATALOG_VERSION, **state, "stats": file_stats}
+            result[filename] = file_stats
+        changed = True
+    if catalog_file is not None and changed:
+        save_catalog(catalog, catalog_file)
+    return result
+
+
+# single pass over the word list, returns a dict with
+#  header: raw header line (without line break, None if there is no header), header_fields: dict of header attributes
+#  entries: number of word entries (a word occurring more than once is counted more than once), words: distinct words
+#  bigrams, shortcuts: total number, and words_with_bigrams, words_with_shortcuts
+#  possibly_offensive, not_a_word: number of entries with the flag
+#  attributes: number of entries for each other attribute name (e.g. originalFreq)
+#  f_histogram: number of entries for each f from 0 to 255, and f_out_of_range for the others (won't compile)
+def word_list_stats(filename: str) -> dict:
+    with open_word_list(filename) as f:
+        # header line as it is in the file, not from iter_entries (DictionaryHeader may change or add attributes)
+        first_line = f.readline()
+        entries = iter_entries(chain([first_line], f))
+        header = first_line.strip() if first_line.startswith("dictionary") else None
+        header_fields = {}
+        if header is not None:
+            for attribute in header.split(","):
+                (name, _, value) = attribute.partition("=")
+                header_fields[name] = value
+        stats = {
+            "header": header,
+            "header_fields": header_fields,
+            "entries": 0,
+            "words": 0,
+            "bigrams": 0,
+            "words_with_bigrams": 0,
+            "shortcuts": 0,
+            "words_with_shortcuts": 0,
+            "possibly_offensive": 0,
+            "not_a_word": 0,
+            "attributes": {},
+            "f_histogram": [0] * 256,
+            "f_out_of_range": 0,
+        }
+        words = set()
+        attributes_count = stats["attributes"]
+        histogram = stats["f_histogram"]
+        for (word, attributes) in entries:
+            stats["entries"] += 1
+            words.add(word)
+            if 0 <= attributes.f <= 255:
+                histogram[attributes.f] += 1
+            else:
+                stats["f_out_of_range"] += 1
+            if attributes.possibly_offensive:
+                stats["possibly_offensive"] += 1
+            if attributes.not_a_word:
+                stats["not_a_word"] += 1
+            bigrams = sum(1 for _ in attributes.bigram_items())
+            if bigrams > 0:
+                stats["bigrams"] += bigrams
+                stats["words_with_bigrams"] += 1
+            shortcuts = sum(1 for _ in attributes.shortcut_items())
+            if shortcuts > 0:
+                stats["shortcuts"] += shortcuts
+                stats["words_with_shortcuts"] += 1
+            for (name, _) in attributes.unknown_items():
+                attributes_count[name] = attributes_count.get(name, 0) + 1
+        stats["words"] = len(words)
+        return stats
+
+
+def load_catalog(filename: str) -> dict[str, dict]:
+    return load_json_store(filename, "creating new catalog")
+
+
+def save_catalog(catalog: dict[str, dict], filename: str):
+    save_json_store(catalog, filename)
+
+
+def file_sha256(filename: str) -> str:
+    h = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
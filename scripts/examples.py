@@ -1,7 +1,9 @@
 #!/bin/python
 import os
-from wordlist_combined import WordlistCombined, DictionaryHeader
+from wordlist_combined import WordlistCombined, DictionaryHeader, read_entries, write_entries
 from wordlist import Wordlist
+from bigrams import BigramSketch
+from binary_dict import BinaryDictionary, read_binary_dict
 from spylls.hunspell import Dictionary
 
 # maybe useful
@@ -13,7 +15,7 @@ from spylls.hunspell import Dictionary
 #  hunspell dicts, are they the same as the one included in phunspell?
 
 # required modules:
-#  os, gzip, shutil, tempfile, time, math, regex
+#  os, gzip, bz2, lzma, shutil, subprocess, tempfile, time, math, regex, mmap, struct, hashlib, zlib, threading, queue, pickle
 #  spylls for dictionary
 #  optionally phunspell for finding hunspell dictionaries by locale
 
@@ -25,14 +27,36 @@ def example_and_description():
         locale,  # try to find dictionary for "en", may fail
         # alternatively provide the dictionary directory, see example below
         # Dictionary.from_files("/home/user/.local/lib/python3.10/site-packages/phunspell/data/dictionary/en/en_US"),
-        {"i"}  # ignore the word "i", which is spylls/hunspell sees as valid word
+        {"i"},  # ignore the word "i", which is spylls/hunspell sees as valid word
+        lookup_cache_size=200000,  # remember this many dictionary lookup results, 0 to disable
+        # for huge corpora: count next words approximately with bounded memory (16 MB sketch + 8 next words per word)
+        # bigram_counts=BigramSketch(capacity=8, width=1 << 20, depth=4),
+        # store parsed dictionaries here, so the next run with the same dictionary loads faster
+        # dictionary_cache_dir="../dictionary_cache",
     )
 
+    # dictionary words can be looked up in the unmunched dictionary instead of spylls (much faster), without adding them
+    #  spylls is still used for other words, e.g. compounds (cache file as for add_words_from_dictionary below)
+    # w.load_lexicon(dict_word_cache_file=f"../dict_cache_{locale}.lexicon")
+
     # performance is not good ca 1 - 30 min for a 1M sentence list (wortschatz.uni-leipzig.de), depending on language,
     # mostly limited by spylls lookup
     w.add_sentence_file("../LICENSE",
                         add_unknown_words=False)  # will add all words, except if starting with upper case if it's the first word in line or sentence
                         # add_unknown_words = True)  # will only add words that pass the spell check
+    # compressed files (.gz, .bz2, .xz) and "-" for stdin can be read too, e.g. w.add_sentence_file("corpus.txt.xz")
+    # for large files, processes can be set to read the file in multiple processes (same result, but faster)
+    # w.add_sentence_file("../LICENSE", add_unknown_words=False, processes=4)
+    # for builds that take hours, save checkpoints and resume after an interruption by running the same code again
+    # w.load_checkpoint("../build.checkpoint")  # before adding anything, returns False if there is no checkpoint
+    # w.add_sentence_file("../LICENSE", add_unknown_words=False, checkpoint="../build.checkpoint")
+    # or in a pipeline of stages (read, tokenize, validate, aggregate) with more workers for the slow validate stage
+    # p = w.sentence_pipeline(add_unknown_words=False, validator_workers=4, validator_processes=True)
+    # w.add_sentence_file_pipeline("../LICENSE", add_unknown_words=False, pipeline=p, stats_interval=60)
+    # p.print_stats()  # items, utilization and queue depth for each stage
+    # two_pass=True first checks each distinct word only once (faster for large files, also works with processes)
+    # w.add_sentence_file("../LICENSE", add_unknown_words=False, two_pass=True)
+    print(f"lookup cache hit rate: {w.lookup_cache.hit_rate()}")  # hits / (hits + misses)
 
     # will add all words from README.md separately (no bigrams)
     # without spell check, but with count (used for word frequencies)
@@ -43,9 +67,12 @@ def example_and_description():
     # cases, e.g. for it_IT)
     # also note that this still may not create all valid words, as in some languages words can be joined to get new
     # valid words (e.g. de_DE)
-    # memory usage depends on word lists and language, expect 0.5 - 2 GB (it_IT requires 4 GB and takes hours)
+    # memory usage depends on word lists and language, words are created in chunks, so mostly the resulting
+    # wordlist is relevant (it_IT still takes hours with a single process)
     w.add_words_from_dictionary(
-        dict_word_cache_file=f"../dict_cache_{locale}.txt"  # optionally store extracted dictionary words in a file
+        # optionally store extracted dictionary words in a file, re-created automatically if the dictionary changes
+        dict_word_cache_file=f"../dict_cache_{locale}.lexicon",
+        processes=1  # create and check words in this many processes
     )
     combined = w.create_wordlist_combined(
         add_nosuggest=True,  # will add "possibly_offensive" to words flagged as "nosuggest" by spylls/hunspell
@@ -68,6 +95,11 @@ def example_and_description():
                         bigrams=True,  # add bigrams to combined (overwrite if same bigram exists with different f)
                         other=True  # add other (unknown) attributes to combined (overwrite if same attribute exists with different value)
                         )
+    # or merge several lists in one pass, without changing them (files are read while merging)
+    # combined.merge_lists(["../wordlists/main_en_GB.combined.gz", en_us_combined],
+    #                      weights=[1, 0.5],  # weights for f of each source
+    #                      f="average",  # "keep", "overwrite", "average", "max" or "sum"
+    #                      bigrams="keep")  # keep existing bigrams, only add new ones (True / "overwrite", or False)
 
     combined.filter_bigrams(
         max_bigram_count=3,  # keep at maximum 3 bigrams
@@ -75,8 +107,16 @@ def example_and_description():
                     # removing high frequency words reduces the number of very common next words (to, the, a, in, ...)
 
     combined.write_to_file("../LICENSE.combined")  # write wordlist file (if ends in ".gz" it will be compressed)
+    # .gz is compressed in parallel, compress_level (default 9) can be lowered for faster writing
+    # combined.write_to_file("../LICENSE.combined.gz", compress_level=6)
     combined.compile("../")  # create a .dict file in the specified folder, determine file name from DictionaryHeader
 #    combined.compile("../main.dict")  # create a .dict file
+#    combined.compile("../main.dict", dicttool=True)  # create the .dict file with dicttool_aosp.jar (needs java)
+
+    # check the compiled dictionary without java (the file is memory-mapped, and only read where needed)
+    with BinaryDictionary(f"../{combined.header.type}_{locale.lower()}.dict") as d:
+        print(d.header.write(), d.frequency("the"), "license" in d)
+    # read_binary_dict("../main_en_us.dict") reads a complete WordlistCombined (with approximate bigram f)
 
 
 if __name__ == "__main__":
@@ -138,3 +178,13 @@ def example_5():
                         add_unknown_words=True)  # add all words to the word list, except some obvious non-words
     c = w.create_wordlist_combined(header=DictionaryHeader("en_US", "main"))
     c.write_to_file("/home/user/wordlist.compiled")  # this file will not compile, as we didn't set a header
+
+
+# filter a word list without loading it completely into memory
+# entries are written in the order they are read, which is fine here as the list is already sorted by f
+def example_6():
+    entries = read_entries("../wordlists/main_en_US.combined.gz", header=True)
+    header = next(entries)  # first item is the header (None if the file has no header)
+    write_entries("/home/user/en_US_no_offensive.combined.gz",
+                  ((word, attributes) for (word, attributes) in entries if not attributes.possibly_offensive),
+                  header)
@@ -4,8 +4,15 @@ import os
 import time
 import gzip
 import langcodes
+import multiprocessing
 import pathlib
-from wordlist_combined import DictionaryHeader, WordlistCombined
+import shutil
+import subprocess
+import tempfile
+from binary_dict import WRITER_VERSION, write_binary_dict
+from catalog import file_sha256, word_list_catalog
+from json_store import load_json_store, save_json_store
+from wordlist_combined import DictionaryHeader, read_entries
 
 # this script generates source entries for the readme from .source files
 # source file format:
@@ -13,6 +20,15 @@ from wordlist_combined import DictionaryHeader, WordlistCombined
 #  language: <language in English (optional, e.g. for toki pona)>
 #  source: <link / text>
 
+# build manifest, for each dictionary (path relative to the repository) the size, modification time and sha256 of the
+#  word list it was compiled from, the writer version, the header and the size of the dictionary file
+#  and "adopted": true if the dictionary existed before and was not compiled (see compile_dicts)
+# a dictionary is compiled again if the word list content or the writer version changed, or the dictionary file is
+#  missing or has a different size
+# the word list is only hashed if size or modification time changed, so checking unchanged dictionaries is fast
+# the manifest is local state (modification times differ for each checkout), it is in .gitignore and not committed
+MANIFEST_FILE = os.path.join(os.path.dirname(__file__), "..", "dictionaries_manifest.json")
+
 
 def get_source_file_names(folder: str) -> list[str]:
     files = []
@@ -31,39 +47,219 @@ def get_source_file_names(folder: str) -> list[str]:
     return files
 
 
+# path of the .dict file for the .source file, relative to the repository, and absolute
+def get_dict_paths(source_file: str) -> tuple[str, str]:
+    filepath = pathlib.Path(source_file)
+    dict_path_relative = filepath.parent.name.replace("wordlists", "dictionaries") + "/" + filepath.stem.lower() + ".dict"
+    return dict_path_relative, os.path.join(filepath.parent.parent, dict_path_relative)
+
+
+# compiles the word list, entries are streamed from the file into the dictionary writer
+# returns (dict_path, seconds, error message or None), so failures can be reported after compiling all dictionaries
+def compile_dict(dict_path: str, word_list_path: str) -> tuple[str, float, str | None]:
+    t = time.time()
+    try:
+        entries = read_entries(word_list_path, header=True)
+        header = next(entries)
+        if header is None:
+            raise ValueError(f"no header in {word_list_path}")
+        os.makedirs(os.path.dirname(dict_path), exist_ok=True)
+        write_binary_dict(dict_path, header, entries)
+    except Exception as e:
+        if os.path.isfile(dict_path):
+            os.remove(dict_path)
+        return dict_path, time.time() - t, f"{type(e).__name__}: {e}"
+    return dict_path, time.time() - t, None
+
+
+def _compile_dict(paths: tuple[str, str]) -> tuple[str, float, str | None]:
+    return compile_dict(*paths)
+
+
 def create_dict_if_not_exists(dict_path: str, word_list_path: str) -> None:
     if os.path.isfile(dict_path):
         return
-    word_list = WordlistCombined.read_from_file(word_list_path)
-    word_list.compile(dict_path)
+    (_, _, error) = compile_dict(dict_path, word_list_path)
+    if error is not None:
+        raise ValueError(f"could not compile {word_list_path}: {error}")
+
+
+# compiles dictionaries for all word lists in the folders in parallel, if they are not up to date in the manifest
+#  (all of them if rebuild)
+# existing dictionaries without manifest entry are considered up to date and only added to the manifest, as they were
+#  compiled before there was a manifest (rebuild if the word lists changed since then)
+#  they are not checked against the word list, so they are marked as adopted in the manifest and printed
+# largest word lists are compiled first, so a large list is not left for the end when other processes are idle
+# prints time for each dictionary, and returns list of (dict_path, error message) for the failed ones
+def compile_dicts(folders: list[str], processes: int | None = None, rebuild: bool = False,
+                  manifest_file: str | None = MANIFEST_FILE) -> list[tuple[str, str]]:
+    manifest = load_manifest(manifest_file) if manifest_file is not None else {}
+    old_manifest = dict(manifest)
+    jobs = []
+    sources = {}
+    adopted = []
+    for folder in folders:
+        for source_file in get_source_file_names(folder):
+            word_list_path = source_file.replace(".source", ".combined.gz")
+            (dict_path_relative, dict_path) = get_dict_paths(source_file)
+            entry = manifest.get(dict_path_relative)
+            source = word_list_state(word_list_path, entry)
+            sources[dict_path] = (dict_path_relative, word_list_path, source)
+            if not rebuild and entry is None and os.path.isfile(dict_path):
+                manifest[dict_path_relative] = {**manifest_entry(word_list_path, source, dict_path), "adopted": True}
+                adopted.append(dict_path_relative)
+            elif rebuild or not is_up_to_date(entry, source, dict_path):
+                jobs.append((dict_path, word_list_path))
+            elif entry["source_mtime_ns"] != source["source_mtime_ns"]:
+                entry = dict(entry)
+                entry["source_mtime_ns"] = source["source_mtime_ns"]
+                manifest[dict_path_relative] = entry
+    if len(adopted) > 0:
+        print(f"added {len(adopted)} existing dictionaries to the manifest without compiling (use rebuild if they are "
+              f"not compiled from the current word lists): {', '.join(sorted(adopted))}")
+    failures = []
+    if len(jobs) > 0:
+        jobs.sort(key=lambda job: os.path.getsize(job[1]), reverse=True)
+        if processes is None:
+            processes = os.cpu_count() or 1
+        t = time.time()
+        context = multiprocessing.get_context("fork")
+        with context.Pool(max(1, min(processes, len(jobs)))) as pool:
+            for (dict_path, seconds, error) in pool.imap_unordered(_compile_dict, jobs):
+                name = os.path.basename(dict_path)
+                (dict_path_relative, word_list_path, source) = sources[dict_path]
+                if error is None:
+                    print(f"compiled {name} in {seconds:.1f} s")
+                    manifest[dict_path_relative] = manifest_entry(word_list_path, source, dict_path)
+                else:
+                    print(f"failed to compile {name} after {seconds:.1f} s: {error}")
+                    failures.append((dict_path, error))
+                    manifest.pop(dict_path_relative, None)
+        print(f"compiled {len(jobs) - len(failures)} of {len(jobs)} dictionaries in {time.time() - t:.1f} s")
+    if manifest_file is not None and manifest != old_manifest:
+        save_manifest(manifest, manifest_file)
+    return failures
+
+
+# compiles all word lists in the folders into a temporary directory, and compares the result with the dictionary in
+#  the repository, and with the dictionary compiled by dicttool_aosp.jar if java is available
+# dictionaries that are not in the repository yet are not checked
+# returns list of (dict_path, reason) for the dictionaries that are different or could not be compiled
+def check_dicts(folders: list[str], processes: int | None = None) -> list[tuple[str, str]]:
+    dicttool = os.path.join(os.path.dirname(__file__), "..", "dicttool_aosp.jar")
+    if shutil.which("java") is None or not os.path.isfile(dicttool):
+        print("java or dicttool_aosp.jar not found, only comparing with the dictionaries in the repository")
+        dicttool = None
+    failures = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        jobs = []
+        missing = []
+        for folder in folders:
+            for source_file in get_source_file_names(folder):
+                (dict_path_relative, dict_path) = get_dict_paths(source_file)
+                if not os.path.isfile(dict_path):
+                    missing.append(dict_path_relative)
+                    continue
+                jobs.append((dict_path, source_file.replace(".source", ".combined.gz"),
+                             os.path.join(tmpdir, dict_path_relative), dicttool))
+        if len(missing) > 0:
+            print(f"not checking {len(missing)} dictionaries that are not in the repository: {', '.join(sorted(missing))}")
+        jobs.sort(key=lambda job: os.path.getsize(job[1]), reverse=True)
+        if processes is None:
+            processes = os.cpu_count() or 1
+        context = multiprocessing.get_context("fork")
+        with context.Pool(max(1, min(processes, len(jobs)))) as pool:
+            for (dict_path, reason) in pool.imap_unordered(_check_dict, jobs):
+                if reason is not None:
+                    print(f"{os.path.basename(dict_path)}: {reason}")
+                    failures.append((dict_path, reason))
+        print(f"{len(jobs) - len(failures)} of {len(jobs)} dictionaries are the same as compiled")
+    return failures
+
+
+def _check_dict(job: tuple[str, str, str, str | None]) -> tuple[str, str | None]:
+    (dict_path, word_list_path, compiled_path, dicttool) = job
+    (_, _, error) = compile_dict(compiled_path, word_list_path)
+    if error is not None:
+        return dict_path, f"could not compile: {error}"
+    with open(compiled_path, "rb") as f:
+        compiled = f.read()
+    with open(dict_path, "rb") as f:
+        if f.read() != compiled:
+            return dict_path, "different from the dictionary in the repository"
+    if dicttool is not None:
+        dicttool_path = compiled_path + ".dicttool"
+        result = subprocess.run(["java", "-jar", dicttool, "makedict", "-s", word_list_path, "-d", dicttool_path],
+                                stdout=subprocess.DEVNULL)
+        if result.returncode != 0:
+            return dict_path, f"dicttool failed with exit code {result.returncode}"
+        with open(dicttool_path, "rb") as f:
+            if f.read() != compiled:
+                return dict_path, "different from the dictionary compiled by dicttool"
+    return dict_path, None
+
 
+def load_manifest(filename: str) -> dict[str, dict]:
+    return load_json_store(filename, "compiling all dictionaries")
 
+
+def save_manifest(manifest: dict[str, dict], filename: str):
+    save_json_store(manifest, filename)
+
+
+# size, modification time and sha256 of the word list, the hash is taken from the manifest entry if size and
+#  modification time are the same
+def word_list_state(word_list_path: str, entry: dict | None) -> dict:
+    stat = os.stat(word_list_path)
+    state = {"source_size": stat.st_size, "source_mtime_ns": stat.st_mtime_ns}
+    if entry is not None and all(entry.get(key) == value for (key, value) in state.items()):
+        state["source_sha256"] = entry["source_sha256"]
+    else:
+        state["source_sha256"] = file_sha256(word_list_path)
+    return state
+
+
+def is_up_to_date(entry: dict | None, source: dict, dict_path: str) -> bool:
+    if entry is None or entry.get("writer_version") != WRITER_VERSION:
+        return False
+    if entry.get("source_sha256") != source["source_sha256"]:
+        return False
+    return os.path.isfile(dict_path) and os.path.getsize(dict_path) == entry.get("dict_size")
+
+
+def manifest_entry(word_list_path: str, source: dict, dict_path: str) -> dict:
+    with gzip.open(word_list_path, "rt", encoding="utf-8") as f:
+        header = f.readline().strip()
+    return {
+        "source": os.path.basename(word_list_path),
+        **source,
+        "writer_version": WRITER_VERSION,
+        "header": header,
+        "dict_size": os.path.getsize(dict_path),
+    }
+
+
+# word count and bigrams are taken from the word list catalog, so unchanged word lists are not read again
 def get_infos(folder: str) -> list[dict]:
     files = get_source_file_names(folder)
-    infos = []
-    for file in files:
-        source_info = {}
-        filepath = pathlib.Path(file)
-        word_list_path = file.replace(".source", ".combined.gz")
+    word_list_paths = [file.replace(".source", ".combined.gz") for file in files]
+    for word_list_path in word_list_paths:
         if not os.path.isfile(word_list_path):
             raise FileNotFoundError("word list does not exist: " + word_list_path)
-        dict_path_relative = filepath.parent.name.replace("wordlists", "dictionaries") + "/" + filepath.stem.lower() + ".dict"
-        create_dict_if_not_exists(filepath.parent.parent.name + "/" + dict_path_relative, word_list_path)
+    catalog = word_list_catalog(word_list_paths)
+    infos = []
+    for (file, word_list_path) in zip(files, word_list_paths):
+        source_info = {}
+        (dict_path_relative, dict_path) = get_dict_paths(file)
+        create_dict_if_not_exists(dict_path, word_list_path)
         source_info["dictfile"] = dict_path_relative
-        with gzip.open(word_list_path, 'rt') as f:
-            header = DictionaryHeader.parse(f.readline())
-            if header is None:
-                sys.exit(f"could not parse header for {file}")
-            source_info["header"] = header
-            wordcount = 0
-            for line in f:
-                if line.startswith(" word="):
-                    wordcount += 1
-            source_info["wordcount"] = wordcount
-            for line in f:
-                if line.trim().startswith("bigram="):
-                    source_info["bigrams"] = True
-                    break
+        stats = catalog[word_list_path]
+        header = DictionaryHeader.parse(stats["header"]) if stats["header"] is not None else None
+        if header is None:
+            sys.exit(f"could not parse header for {file}")
+        source_info["header"] = header
+        source_info["wordcount"] = stats["entries"]
+        source_info["bigrams"] = stats["bigrams"] > 0
         with open(file) as f:
             for line in f:
                 if ":" not in line:
@@ -100,6 +296,16 @@ def info_to_text(info: dict) -> str:
 
 
 def main():
+    # --check only compares the compiled word lists with the dictionaries, and fails if any of them is different
+    if "--check" in sys.argv:
+        failures = check_dicts(["wordlists", "wordlists_experimental"])
+        if len(failures) > 0:
+            sys.exit("different: " + ", ".join(os.path.basename(dict_path) for (dict_path, _) in failures))
+        return
+    # compile dictionaries that are missing or not up to date first, all of them with --rebuild
+    failures = compile_dicts(["wordlists", "wordlists_experimental"], rebuild="--rebuild" in sys.argv)
+    if len(failures) > 0:
+        sys.exit("could not compile " + ", ".join(os.path.basename(dict_path) for (dict_path, _) in failures))
     readmefile = os.path.join(os.path.dirname(__file__), "..", "README.md")
     outlines = []
     with open(readmefile) as f:
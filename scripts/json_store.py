@@ -0,0 +1,29 @@
+#!/bin/python
+import json
+import os
+
+# json files with a dict by file name, used for caching things about files (word list catalog, build manifest)
+# entries are sorted by key when saving, so the files have a stable order and small diffs
+
+
+# returns an empty dict if the file doesn't exist or can't be read, in the latter case action is printed with the error
+#  (what is done instead, e.g. "creating new catalog")
+def load_json_store(filename: str, action: str) -> dict[str, dict]:
+    if not os.path.isfile(filename):
+        return {}
+    try:
+        with open(filename, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"error reading {filename}, {action}: {e}")
+        return {}
+
+
+# the file is written under a temporary name first (per process, as several builds may run at the same time), so an
+#  interrupted write does not leave a broken file
+def save_json_store(store: dict[str, dict], filename: str):
+    temp_filename = f"{filename}.{os.getpid()}.tmp"
+    with open(temp_filename, "w", encoding="utf-8") as f:
+        json.dump(dict(sorted(store.items())), f, indent=1, ensure_ascii=False)
+        f.write("\n")
+    os.replace(temp_filename, filename)
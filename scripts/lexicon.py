@@ -0,0 +1,210 @@
+#!/bin/python
+import mmap
+import os
+import pickle
+import struct
+import sys
+import zlib
+from array import array
+
+# sorted word list with nosuggest flags in a compact binary file, used as cache for unmunched dictionary words
+# the file is memory-mapped, so loading takes no time, and words can be looked up without reading everything
+#  processes using the same file share the memory (page cache), so memory does not grow with the number of workers
+#  a pickled Lexicon only contains the file name, so workers attach to the same file instead of copying the words
+#  a temporary Lexicon (file removed after opening) can't be pickled, but forked workers can still use it
+# layout (integers are little endian):
+#  header, see HEADER
+#   magic, format version, key (32 bytes, e.g. sha256 of the source files), word count,
+#   offset and count of block offsets, offset of nosuggest bitmap, offset and slot count of hash index
+#  string block: words sorted by code point (same as utf-8 byte order), front-coded in blocks of BLOCK_SIZE words
+#   each word is: length of prefix shared with the previous word (varint), length of the rest (varint), rest (utf-8)
+#   the first word of a block is stored completely
+#  block offsets: u32 per block, position of the block in the file
+#  nosuggest bitmap: one bit per word (bit i % 8 of byte i // 8)
+#  hash index: open addressing table (linear probing) with a power of 2 number of slots, at most 3/4 used
+#   each slot is crc32 of the utf-8 word and word index + 1 (u32 each), or 0, 0 if empty
+
+MAGIC = b"WLLX"
+FORMAT_VERSION = 2
+HEADER = struct.Struct("<4sH32sIIIIII")
+BLOCK_OFFSET = struct.Struct("<I")
+HASH_SLOT = struct.Struct("<II")
+BLOCK_SIZE = 16
+
+
+class Lexicon:
+    # temporary: the file is removed while the Lexicon is used, so it can't be opened again when unpickling
+    def __init__(self, filename: str, temporary: bool = False):
+        self.filename = filename
+        self.temporary = temporary
+        with open(filename, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.data) < HEADER.size:
+            raise ValueError(f"{filename} is not a lexicon file")
+        (magic, version) = struct.unpack_from("<4sH", self.data, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{filename} is not a lexicon file")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{filename} has unsupported lexicon format version {version}")
+        (_, _, self.key, self.word_count, self.offsets_offset, self.block_count, self.nosuggest_offset,
+         self.hash_offset, self.hash_slots) = HEADER.unpack_from(self.data, 0)
+
+    def close(self):
+        self.data.close()
+
+    def __getstate__(self):
+        if self.temporary:
+            raise pickle.PicklingError(f"can't pickle temporary lexicon {self.filename}, as the file is removed "
+                                       f"(use a dict_word_cache_file for a lexicon shared with other processes)")
+        return self.filename
+
+    def __setstate__(self, filename: str):
+        self.__init__(filename)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.word_count
+
+    # yields (word, nosuggest) in order
+    def __iter__(self):
+        for block in range(self.block_count):
+            yield from self._block(block)
+
+    def __contains__(self, word: str) -> bool:
+        return self.get(word) is not None
+
+    # returns nosuggest for the word, or None if the word is not in the lexicon
+    def get(self, word: str) -> bool | None:
+        encoded = word.encode("utf-8")
+        word_hash = zlib.crc32(encoded)
+        mask = self.hash_slots - 1
+        slot = word_hash & mask
+        while True:
+            (slot_hash, index) = HASH_SLOT.unpack_from(self.data, self.hash_offset + HASH_SLOT.size * slot)
+            if index == 0:
+                return None
+            if slot_hash == word_hash and self.word(index - 1, encoded=True) == encoded:
+                return self.nosuggest(index - 1)
+            slot = (slot + 1) & mask
+
+    # word at index (in sorted order)
+    def word(self, index: int, encoded: bool = False) -> str | bytes:
+        position = self._block_offset(index // BLOCK_SIZE)
+        word = b""
+        for _ in range(index % BLOCK_SIZE + 1):
+            shared, position = read_varint(self.data, position)
+            length, position = read_varint(self.data, position)
+            word = word[:shared] + self.data[position:position + length]
+            position += length
+        return word if encoded else word.decode("utf-8")
+
+    def nosuggest(self, index: int) -> bool:
+        return bool(self.data[self.nosuggest_offset + index // 8] & (1 << (index % 8)))
+
+    def _block_offset(self, block: int) -> int:
+        return BLOCK_OFFSET.unpack_from(self.data, self.offsets_offset + 4 * block)[0]
+
+    def _block(self, block: int):
+        position = self._block_offset(block)
+        index = block * BLOCK_SIZE
+        word = b""
+        for index in range(index, min(index + BLOCK_SIZE, self.word_count)):
+            shared, position = read_varint(self.data, position)
+            length, position = read_varint(self.data, position)
+            word = word[:shared] + self.data[position:position + length]
+            position += length
+            yield word.decode("utf-8"), self.nosuggest(index)
+
+
+# writes (word, nosuggest) from words, which must be sorted by word and without duplicates
+# words is only iterated once, so it can be a generator for lists that don't fit in memory
+# the file is written under a temporary name first, so an interrupted write does not leave a broken file
+def write_lexicon(filename: str, key: bytes, words):
+    temp_filename = filename + ".tmp"
+    block_offsets = []
+    nosuggest = bytearray()
+    hashes = array("I")
+    count = 0
+    with open(temp_filename, "wb") as f:
+        f.write(bytes(HEADER.size))
+        position = HEADER.size
+        previous_word = b""
+        for (word, word_nosuggest) in words:
+            encoded = word.encode("utf-8")
+            if count % BLOCK_SIZE == 0:
+                block_offsets.append(position)
+                shared = 0
+            else:
+                shared = shared_prefix_length(previous_word, encoded)
+            hashes.append(zlib.crc32(encoded))
+            entry = varint(shared) + varint(len(encoded) - shared) + encoded[shared:]
+            f.write(entry)
+            position += len(entry)
+            if count % 8 == 0:
+                nosuggest.append(0)
+            if word_nosuggest:
+                nosuggest[-1] |= 1 << (count % 8)
+            previous_word = encoded
+            count += 1
+        offsets_offset = position
+        f.write(struct.pack(f"<{len(block_offsets)}I", *block_offsets))
+        nosuggest_offset = offsets_offset + 4 * len(block_offsets)
+        f.write(nosuggest)
+        hash_offset = nosuggest_offset + len(nosuggest)
+        hash_slots = 1
+        while hash_slots * 3 < count * 4:
+            hash_slots *= 2
+        f.write(hash_index(hashes, hash_slots))
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, key, count, offsets_offset, len(block_offsets), nosuggest_offset,
+                            hash_offset, hash_slots))
+    os.replace(temp_filename, filename)
+
+
+# hash index for words with the given hashes, see file layout
+def hash_index(hashes: array, slots: int) -> bytes:
+    table = array("I", bytes(8 * slots))
+    mask = slots - 1
+    for (index, word_hash) in enumerate(hashes):
+        slot = word_hash & mask
+        while table[2 * slot + 1] != 0:
+            slot = (slot + 1) & mask
+        table[2 * slot] = word_hash
+        table[2 * slot + 1] = index + 1
+    if sys.byteorder != "little":
+        table.byteswap()
+    return table.tobytes()
+
+
+def shared_prefix_length(a: bytes, b: bytes) -> int:
+    length = min(len(a), len(b))
+    for i in range(length):
+        if a[i] != b[i]:
+            return i
+    return length
+
+
+def varint(value: int) -> bytes:
+    result = bytearray()
+    while value >= 0x80:
+        result.append((value & 0x7F) | 0x80)
+        value >>= 7
+    result.append(value)
+    return bytes(result)
+
+
+def read_varint(data, position: int) -> tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        b = data[position]
+        position += 1
+        value |= (b & 0x7F) << shift
+        if b < 0x80:
+            return value, position
+        shift += 7
@@ -0,0 +1,237 @@
+#!/bin/python
+import heapq
+import multiprocessing
+import queue
+import threading
+import time
+
+# simple pipeline of stages connected by bounded queues
+# each stage applies its function to each item, in one or more workers (threads, or processes for work that holds the
+#  GIL, like spylls lookups), and items are yielded by Pipeline.run in the order of the input
+# as queues are bounded (queue_size items), a slow stage makes the previous stages wait instead of filling memory
+#  items finished out of order wait in run until they can be yielded, so the number of items between source and sink
+#  is limited too (max_pending, by default enough to fill all queues and workers)
+# stats() shows items, busy time and queue depth for each stage, so it's visible which stage needs more workers
+#  the source (reading the input) and the sink (whatever is done with the output of run) are included
+
+
+class Stage:
+    def __init__(self, name: str, function, workers: int = 1, processes: bool = False):
+        self.name = name
+        # function of one item, must be picklable if processes (with fork, closures are fine as they are not pickled)
+        self.function = function
+        self.workers = workers
+        self.processes = processes
+
+
+class Pipeline:
+    def __init__(self, stages: list[Stage], queue_size: int = 8, source_name: str = "source", sink_name: str = "sink",
+                 max_pending: int | None = None):
+        self.stages = stages
+        self.queue_size = queue_size
+        if max_pending is None:
+            max_pending = queue_size * (len(stages) + 1) + sum(stage.workers for stage in stages)
+        self.max_pending = max(max_pending, 1)
+        self.source_name = source_name
+        self.sink_name = sink_name
+        self.context = multiprocessing.get_context("fork")
+        self._counters: list[_Counter] = []
+        self._queues: list = []
+        self._start_time: float | None = None
+
+    # yields function results of all stages for each item, in the order of items
+    # items is iterated in a background thread
+    def run(self, items):
+        stop = threading.Event()
+        # released for each yielded item, so the source waits while max_pending items are not yielded yet
+        pending = threading.BoundedSemaphore(self.max_pending)
+        # queues[i] is the input of stages[i], and queues[-1] the output of the last stage
+        self._queues = []
+        for i in range(len(self.stages) + 1):
+            uses_processes = any(stage.processes for stage in self.stages[max(i - 1, 0):i + 1])
+            self._queues.append(self.context.Queue(self.queue_size) if uses_processes else queue.Queue(self.queue_size))
+        self._counters = [_Counter(self.context, stage.processes) for stage in self.stages] + [_Counter(), _Counter()]
+        self._start_time = time.perf_counter()
+        stage_workers = []
+        processes = []
+        for (i, stage) in enumerate(self.stages):
+            args = (stage.function, self._queues[i], self._queues[i + 1], self._counters[i])
+            if stage.processes:
+                workers = [self.context.Process(target=_work, args=args, daemon=True) for _ in range(stage.workers)]
+                processes += workers
+            else:
+                workers = [threading.Thread(target=_work, args=args, daemon=True) for _ in range(stage.workers)]
+            stage_workers.append(workers)
+        # start processes before threads, as forking a process with running threads can be trouble
+        for worker in processes:
+            worker.start()
+        for workers in stage_workers:
+            for worker in workers:
+                if not isinstance(worker, multiprocessing.process.BaseProcess):
+                    worker.start()
+        # when all workers of a stage are done, the workers of the next stage are told to stop
+        for (i, workers) in enumerate(stage_workers):
+            next_workers = self.stages[i + 1].workers if i + 1 < len(self.stages) else 1
+            threading.Thread(target=_finish_stage, args=(workers, self._queues[i + 1], next_workers, stop),
+                             daemon=True).start()
+        first_workers = self.stages[0].workers if len(self.stages) > 0 else 1
+        threading.Thread(target=_feed, args=(items, self._queues[0], first_workers, self._counters[-2], pending, stop),
+                         daemon=True).start()
+
+        finished = False
+        try:
+            output = self._queues[-1]
+            sink = self._counters[-1]
+            waiting = []  # heap of (index, result) that can't be yielded yet
+            next_index = 0
+            while True:
+                item = output.get()
+                if item is None:
+                    break
+                heapq.heappush(waiting, item)
+                while len(waiting) > 0 and waiting[0][0] == next_index:
+                    (_, result) = heapq.heappop(waiting)
+                    if isinstance(result, _Failure):
+                        raise result.exception
+                    start = time.perf_counter()
+                    yield result
+                    sink.add(time.perf_counter() - start)
+                    next_index += 1
+                    pending.release()
+            finished = True
+        finally:
+            stop.set()
+            if not finished:
+                # workers may be waiting for a full queue
+                for worker in processes:
+                    worker.terminate()
+            for worker in processes:
+                worker.join()
+
+    # list of dicts with name, workers, items, busy (seconds summed over all workers), items_per_second (items per
+    #  busy second of a single worker), utilization (busy time / (time since start * workers)) and queue_depth (items
+    #  waiting for this stage)
+    def stats(self) -> list[dict]:
+        if self._start_time is None:
+            return []
+        elapsed = time.perf_counter() - self._start_time
+        names = [self.source_name] + [stage.name for stage in self.stages] + [self.sink_name]
+        workers = [1] + [stage.workers for stage in self.stages] + [1]
+        counters = [self._counters[-2]] + self._counters[:-2] + [self._counters[-1]]
+        queues = [None] + self._queues
+        stats = []
+        for (name, worker_count, counter, input_queue) in zip(names, workers, counters, queues):
+            (items, busy) = counter.get()
+            stats.append({
+                "name": name,
+                "workers": worker_count,
+                "items": items,
+                "busy": busy,
+                "items_per_second": items / busy if busy > 0 else 0.0,
+                "utilization": busy / (elapsed * worker_count) if elapsed > 0 else 0.0,
+                "queue_depth": _queue_size(input_queue) if input_queue is not None else 0,
+            })
+        return stats
+
+    def print_stats(self):
+        for stage in self.stats():
+            print(f"{stage['name']}: {stage['workers']} workers, {stage['items']} items, "
+                  f"{stage['items_per_second']:.1f} items/s per worker, utilization {stage['utilization']:.0%}, "
+                  f"queue depth {stage['queue_depth']}")
+
+
+# exception in a stage, it's raised by Pipeline.run when the item would be yielded
+class _Failure:
+    def __init__(self, exception: BaseException):
+        self.exception = exception
+
+
+# item count and busy time, shared with worker processes if needed
+class _Counter:
+    def __init__(self, context=None, processes: bool = False):
+        if processes:
+            self.values = context.Array("d", 2)
+            self.lock = self.values.get_lock()
+        else:
+            self.values = [0, 0.0]
+            self.lock = threading.Lock()
+
+    def add(self, busy: float):
+        with self.lock:
+            self.values[0] += 1
+            self.values[1] += busy
+
+    def get(self) -> tuple[int, float]:
+        with self.lock:
+            return int(self.values[0]), self.values[1]
+
+
+def _work(function, inputs, outputs, counter: _Counter):
+    while True:
+        item = inputs.get()
+        if item is None:
+            return
+        (index, value) = item
+        if not isinstance(value, _Failure):
+            start = time.perf_counter()
+            try:
+                value = function(value)
+            except Exception as e:
+                value = _Failure(e)
+            counter.add(time.perf_counter() - start)
+        outputs.put((index, value))
+
+
+def _feed(items, outputs, workers: int, counter: _Counter, pending: threading.Semaphore, stop: threading.Event):
+    index = 0
+    try:
+        iterator = iter(items)
+        while not stop.is_set():
+            if not pending.acquire(timeout=0.1):
+                continue
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                break
+            counter.add(time.perf_counter() - start)
+            if not _put(outputs, (index, item), stop):
+                return
+            index += 1
+    except Exception as e:
+        _put(outputs, (index, _Failure(e)), stop)
+    for _ in range(workers):
+        _put(outputs, None, stop)
+
+
+# waits for the workers (threads and processes) of a stage, and tells the next stage to stop
+# if run stops early, workers may never finish, run terminates and joins the processes then
+def _finish_stage(workers: list, outputs, next_workers: int, stop: threading.Event):
+    for worker in workers:
+        while not stop.is_set():
+            worker.join(0.1)
+            if not worker.is_alive():
+                break
+        if stop.is_set():
+            return
+    for _ in range(next_workers):
+        _put(outputs, None, stop)
+
+
+# put that gives up if stop is set, returns whether the item was put
+def _put(outputs, item, stop: threading.Event) -> bool:
+    while not stop.is_set():
+        try:
+            outputs.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _queue_size(q) -> int:
+    try:
+        return q.qsize()
+    except NotImplementedError:
+        # multiprocessing queues on macOS
+        return 0
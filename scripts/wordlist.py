@@ -1,38 +1,167 @@
 #!/bin/python
+import bz2
+import codecs
+import dataclasses
+import gc
+import glob
+import gzip
+import hashlib
+import heapq
+import importlib.metadata
+import io
+import json
+import locale
+import lzma
 import math
+import multiprocessing
 import os
+import pickle
+import queue
+import re
 import sys
+import tempfile
+import threading
 import time
+import weakref
 import regex
+from collections import OrderedDict
 from spylls.hunspell import Dictionary
 from wordlist_combined import WordlistCombined, DictionaryHeader, WordAttributes
+from lexicon import Lexicon, write_lexicon
+from bigrams import BigramCounts, BigramSketch
+from pipeline import Pipeline, Stage
 
 # todo:
 #  maybe ignore compound words like 'long-term'? will android actually suggest them?
 
 
+# increase when changing unmunch_word or valid_dictionary_word, so cached results are not used any more
+UNMUNCH_VERSION = 1
+# increase when the checkpoint contents change
+CHECKPOINT_VERSION = 2
+# increase when the dictionary snapshot contents change
+DICTIONARY_SNAPSHOT_VERSION = 1
+
+
+# affixes of a hunspell dictionary by flag, for quickly finding the affixes applicable to a word
+# whether an affix condition matches only depends on the last (suffix) or first (prefix) few characters of the word,
+#  so the applicable affixes of a flag are stored by those characters, and re-used for other words ending
+#  (or starting) the same way
+class AffixIndex:
+    def __init__(self, aff):
+        self.suffix_groups = {flag: _AffixGroup(suffixes, True) for (flag, suffixes) in aff.SFX.items()}
+        self.prefix_groups = {flag: _AffixGroup(prefixes, False) for (flag, prefixes) in aff.PFX.items()}
+
+    def suffixes(self, flags, word: str) -> list:
+        result = []
+        for flag in flags:
+            group = self.suffix_groups.get(flag)
+            if group is not None:
+                result.extend(group.matching(word))
+        return result
+
+    def prefixes(self, flags, word: str) -> list:
+        result = []
+        for flag in flags:
+            group = self.prefix_groups.get(flag)
+            if group is not None:
+                result.extend(group.matching(word))
+        return result
+
+
+# affixes with the same flag, grouped by condition
+class _AffixGroup:
+    def __init__(self, affixes: list, is_suffix: bool):
+        self.is_suffix = is_suffix
+        by_condition: dict[str, list] = {}
+        for affix in affixes:
+            by_condition.setdefault(affix.condition, []).append(affix)
+        self.conditions = [(affixes[0].cond_regexp, tuple(affixes)) for affixes in by_condition.values()]
+        lengths = [condition_length(condition) for condition in by_condition]
+        # None if we can't tell which characters are relevant
+        self.length: int | None = None if None in lengths else max(lengths, default=0)
+        self.cache: dict[str, tuple] = {}
+
+    def matching(self, word: str) -> tuple:
+        if self.length is None:
+            return self._matching(word)
+        if self.length == 0:
+            key = ""
+        elif self.is_suffix:
+            key = word[-self.length:]
+        else:
+            key = word[:self.length]
+        result = self.cache.get(key)
+        if result is None:
+            result = self._matching(key)
+            self.cache[key] = result
+        return result
+
+    def _matching(self, word: str) -> tuple:
+        return tuple(affix for (cond_regexp, affixes) in self.conditions if cond_regexp.search(word) for affix in affixes)
+
+
+# number of characters a hunspell affix condition applies to, e.g. 2 for "[^aeiou]y"
+# None if the condition contains anything other than characters, "." and [...] groups
+def condition_length(condition: str) -> int | None:
+    length = 0
+    i = 0
+    while i < len(condition):
+        c = condition[i]
+        if c == "[":
+            start = i + 1
+            if condition[start:start + 1] == "^":
+                start += 1
+            # "]" directly after "[" or "[^" is a character in the group
+            end = condition.find("]", start + 1)
+            if end == -1:
+                return None
+            i = end + 1
+        elif c in "\\()|*+?{}^$":
+            return None
+        else:
+            i += 1
+        length += 1
+    return length
+
+
+# (weak reference to the Aff, AffixIndex) by id of the Aff, the entry is removed when the Aff is deleted
+#  not a WeakKeyDictionary, as Aff is not hashable
+_affix_indexes: dict[int, tuple[weakref.ref, AffixIndex]] = {}
+
+
+# AffixIndex for the dictionary, created only once per dictionary
+def affix_index(dictionary: Dictionary) -> AffixIndex:
+    return aff_affix_index(dictionary.aff)
+
+
+# AffixIndex for the affixes of a dictionary, created only once per Aff
+def aff_affix_index(aff) -> AffixIndex:
+    key = id(aff)
+    entry = _affix_indexes.get(key)
+    if entry is not None and entry[0]() is aff:
+        return entry[1]
+    index = AffixIndex(aff)
+    _affix_indexes[key] = (weakref.ref(aff, lambda _: _affix_indexes.pop(key, None)), index)
+    return index
+
+
 # from https://github.com/zverok/spylls/blob/master/examples/unmunch.py
-def unmunch_word(word, aff):
+# with affix conditions checked using AffixIndex
+def unmunch_word(word, aff, affix_index: AffixIndex | None = None):
     result = set()
 
     if aff.FORBIDDENWORD and aff.FORBIDDENWORD in word.flags:
         return result
 
+    if affix_index is None:
+        affix_index = aff_affix_index(aff)
+
     if not (aff.NEEDAFFIX and aff.NEEDAFFIX in word.flags):
         result.add(word.stem)
 
-    suffixes = [
-        suffix
-        for flag in word.flags
-        for suffix in aff.SFX.get(flag, [])
-        if suffix.cond_regexp.search(word.stem)
-    ]
-    prefixes = [
-        prefix
-        for flag in word.flags
-        for prefix in aff.PFX.get(flag, [])
-        if prefix.cond_regexp.search(word.stem)
-    ]
+    suffixes = affix_index.suffixes(word.flags, word.stem)
+    prefixes = affix_index.prefixes(word.flags, word.stem)
 
     for suffix in suffixes:
         root = word.stem[0:-len(suffix.strip)] if suffix.strip else word.stem
@@ -40,16 +169,14 @@ def unmunch_word(word, aff):
         if not (aff.NEEDAFFIX and aff.NEEDAFFIX in suffix.flags):
             result.add(suffixed)
 
-        secondary_suffixes = [
-            suffix2
-            for flag in suffix.flags
-            for suffix2 in aff.SFX.get(flag, [])
-            if suffix2.cond_regexp.search(suffixed)
-        ]
-        for suffix2 in secondary_suffixes:
+        for suffix2 in affix_index.suffixes(suffix.flags, suffixed):
             root = suffixed[0:-len(suffix2.strip)] if suffix2.strip else suffixed
             result.add(root + suffix2.add)
 
+    if len(prefixes) == 0:
+        return result
+
+    suffix_ids = {id(suffix) for suffix in suffixes}
     for prefix in prefixes:
         root = word.stem[len(prefix.strip):]
         prefixed = prefix.add + root
@@ -59,35 +186,97 @@ def unmunch_word(word, aff):
         if prefix.crossproduct:
             additional_suffixes = [
                 suffix
-                for flag in prefix.flags
-                for suffix in aff.SFX.get(flag, [])
-                if suffix.crossproduct and not suffix in suffixes and suffix.cond_regexp.search(prefixed)
+                for suffix in affix_index.suffixes(prefix.flags, prefixed)
+                if suffix.crossproduct and id(suffix) not in suffix_ids
             ]
             for suffix in suffixes + additional_suffixes:
                 root = prefixed[0:-len(suffix.strip)] if suffix.strip else prefixed
                 suffixed = root + suffix.add
                 result.add(suffixed)
 
-                secondary_suffixes = [
-                    suffix2
-                    for flag in suffix.flags
-                    for suffix2 in aff.SFX.get(flag, [])
-                    if suffix2.crossproduct and suffix2.cond_regexp.search(suffixed)
-                ]
-                for suffix2 in secondary_suffixes:
-                    root = suffixed[0:-len(suffix2.strip)] if suffix2.strip else suffixed
-                    result.add(root + suffix2.add)
+                for suffix2 in affix_index.suffixes(suffix.flags, suffixed):
+                    if suffix2.crossproduct:
+                        root = suffixed[0:-len(suffix2.strip)] if suffix2.strip else suffixed
+                        result.add(root + suffix2.add)
 
     return result
 
 
 def unmunch_dictionary(dictionary: Dictionary) -> set[str]:
     result = set()
+    index = affix_index(dictionary)
     for word in dictionary.dic.words:
-        result.update(unmunch_word(word, dictionary.aff))
+        result.update(unmunch_word(word, dictionary.aff, index))
     return result
 
 
+# unmunches the dictionary stems in chunks, and writes the valid words of each chunk to a sorted file in spill_dir
+# returns the file names (in order of chunks)
+def unmunch_dictionary_files(dictionary: Dictionary, spill_dir: str, processes: int = 1,
+                             stems_per_chunk: int = 1000) -> list[str]:
+    chunks = [(start, min(start + stems_per_chunk, len(dictionary.dic.words)), spill_dir)
+              for start in range(0, len(dictionary.dic.words), stems_per_chunk)]
+    affix_index(dictionary)  # create before fork, so workers don't need to create it
+    if processes > 1 and len(chunks) > 1:
+        # fork, so the workers can use the dictionary without pickling
+        context = multiprocessing.get_context("fork")
+        with context.Pool(min(processes, len(chunks)), initializer=_init_unmunch_worker,
+                          initargs=(dictionary,)) as pool:
+            return pool.map(_unmunch_chunk, chunks, chunksize=1)
+    _init_unmunch_worker(dictionary)
+    return [_unmunch_chunk(chunk) for chunk in chunks]
+
+
+# unmunch may create word fragments
+#  remove words that are not valid according to dictionary
+#  or that start or end with -
+# unfortunately this can be really slow depending on language, seen from a few seconds up to hours (cs)
+#  but with the cache it's ok
+# returns nosuggest for the word, or None if the word is not valid
+def valid_dictionary_word(dictionary: Dictionary, word: str) -> bool | None:
+    if word.startswith("-") or word.endswith("-") or word.isdigit():
+        return None
+    # don't care about whether word is already in word_infos, we only want hunspell words
+    if dictionary.lookuper(word, capitalization=False, allow_nosuggest=False):
+        return False
+    if dictionary.lookuper(word, capitalization=False, allow_nosuggest=True):
+        return True
+    return None
+
+
+# merges sorted files with one word and nosuggest per line, yields (word, nosuggest) in order without duplicates
+# with many files, groups of files are merged into intermediate files first, so not too many files are open
+def merge_word_files(files: list[str], spill_dir: str, max_open_files: int = 64):
+    level = 0
+    while len(files) > max_open_files:
+        merged_files = []
+        for i in range(0, len(files), max_open_files):
+            merged_file = os.path.join(spill_dir, f"merged_{level}_{i}.txt")
+            with open(merged_file, "w", encoding="utf-8", newline="\n") as f:
+                for (word, nosuggest) in merge_word_files(files[i:i + max_open_files], spill_dir, max_open_files):
+                    f.write(f"{word}\t{int(nosuggest)}\n")
+            merged_files.append(merged_file)
+        for file in files:
+            os.remove(file)
+        files = merged_files
+        level += 1
+    opened = [open(file, encoding="utf-8", newline="\n") for file in files]
+    try:
+        previous_word = None
+        for (word, nosuggest) in heapq.merge(*[(_word_file_entry(line) for line in f) for f in opened]):
+            if word != previous_word:
+                yield word, nosuggest
+                previous_word = word
+    finally:
+        for f in opened:
+            f.close()
+
+
+def _word_file_entry(line: str) -> tuple[str, bool]:
+    (word, nosuggest) = line[:-1].rsplit("\t", 1)
+    return word, nosuggest == "1"
+
+
 class Wordlist:
     def __init__(self,
                  # spylls dictionary, or locale or path
@@ -95,13 +284,25 @@ class Wordlist:
                  # words that should be ignored, typically (international) names we don't want in a language word list,
                  #  can also be common issues, e.g. "i" is recommended for English as usually "I" is meant, but "i" is
                  #  correct too according to spylls/hunspell
-                 ignore_words: set[str] | None = None
+                 ignore_words: set[str] | None = None,
+                 # number of dictionary lookup results to keep, 0 to disable
+                 #  the same unknown or capitalized words are found again and again, and dictionary lookup is slow
+                 lookup_cache_size: int = 200000,
+                 # counts of next words, BigramCounts by default
+                 #  for huge corpora, BigramSketch keeps memory bounded, but counts are only approximate
+                 bigram_counts: BigramCounts | BigramSketch | None = None,
+                 # folder for snapshots of parsed dictionaries and found dictionary paths, see load_dictionary
+                 #  only used if dictionary is a locale or path
+                 dictionary_cache_dir: str | None = None
                  ):
+        # path of the dictionary files without .aff / .dic, if known
+        self.dictionary_path: str | None = None
         if isinstance(dictionary, str):
             if "/" in dictionary:
-                self.dictionary = Dictionary.from_files(dictionary)
+                self.dictionary_path = dictionary
             else:
-                self.dictionary = find_dict(dictionary)
+                self.dictionary_path = find_dict_path(dictionary, dictionary_cache_dir)
+            self.dictionary = load_dictionary(self.dictionary_path, dictionary_cache_dir)
         else:
             self.dictionary = dictionary
         self.dict_words: set[str] = set()
@@ -129,11 +330,24 @@ class Wordlist:
 
         # for each word, contains a dict with:
         #  count: int (always)
-        #  next: dict[str, int] (not always)
-        #   how often the word is followed by some others (next_word, count)
         #  nosuggest: bool (usually only if True, as determined by hunspell dict)
         self.word_infos: dict = {}
 
+        # how often a word is followed by some others, see bigram_counts.next_counts(word)
+        self.bigram_counts = BigramCounts() if bigram_counts is None else bigram_counts
+
+        # results of _dictionary_verdict by (word, try_decapitalize)
+        self.lookup_cache = LookupCache(lookup_cache_size)
+        # results of _dictionary_verdict collected before adding a file (processes > 1, two_pass, pipeline)
+        self._verdicts: dict | None = None
+        # unmunched dictionary words with nosuggest (dict, or Lexicon if not in memory), see load_lexicon
+        self.lexicon: dict[str, bool] | Lexicon | None = None
+
+        # bytes read by absolute file name, for files added with checkpoint (see add_sentence_file)
+        self.input_positions: dict[str, int] = {}
+        # process writing a checkpoint in background, see save_checkpoint
+        self._checkpoint_pid: int | None = None
+
     # regex for that kicks out things that are definitely not words
     # next word will be treated as ngram start
     # allow letters, and ' and - (but not at start/end)
@@ -141,47 +355,82 @@ class Wordlist:
 
     # adds words that are valid according to dictionary (hunspell "unmunch")
     # this is useful for adding many word form that are valid but not used frequently
-    def add_words_from_dictionary(self, dict_word_cache_file: str | None = None):
-        unmunched: set[str] = set()
-        if dict_word_cache_file is not None and os.path.isfile(dict_word_cache_file):
-            try:
-                with open(dict_word_cache_file) as f:
-                    for w in f:
-                        unmunched.add(w.strip())
-            except:
-                print(f"error reading {dict_word_cache_file}")
-        if len(unmunched) == 0:
-            s = unmunch_dictionary(self.dictionary)
-            # unmunch may create word fragments
-            #  remove words that are not valid according to dictionary
-            #  or that start or end with -
-            # unfortunately this can be really slow depending on language, seen from a few seconds up to hours (cs)
-            #  but with the cache it's ok
-            for word in s:
-                if not word.startswith("-") and not word.endswith("-") and not word.isdigit():
-                    # don't care about whether word is already in word_infos, we only want hunspell words
-                    if self.dictionary.lookuper(word, capitalization=False, allow_nosuggest=False):
-                        unmunched.add(word)
-                    elif self.dictionary.lookuper(word, capitalization=False, allow_nosuggest=True):
-                        unmunched.add(f"nosuggest:{word}")
-            if dict_word_cache_file is not None:
-                try:
-                    with open(dict_word_cache_file, 'w') as f:
-                        f.writelines([str(i) + '\n' for i in unmunched])
-                except:
-                    print(f"could not write to {dict_word_cache_file}")
-
+    # unmunched words are created in chunks of stems_per_chunk stems (in parallel if processes > 1), each chunk is
+    #  validated and written to a sorted spill file, and the spill files are merged
+    #  so only one chunk per process needs to be in memory (plus word_infos of course)
+    # dict_word_cache_file is a Lexicon file, which is re-created if it's not for the current dictionary files
+    #  (or unmunch version)
+    def add_words_from_dictionary(self, dict_word_cache_file: str | None = None, processes: int = 1,
+                                  stems_per_chunk: int = 1000):
         count = 0
-        for word in unmunched:
-            if word not in self.ignore_words and word not in self.word_infos:
-                if word.startswith("nosuggest:"):
-                    word = word[10:]
-                    self.add_word(word, True)
-                else:
-                    self.add_word(word)
-                count += 1
+        if dict_word_cache_file is None:
+            with tempfile.TemporaryDirectory() as spill_dir:
+                spill_files = unmunch_dictionary_files(self.dictionary, spill_dir, processes, stems_per_chunk)
+                for (word, nosuggest) in merge_word_files(spill_files, spill_dir):
+                    count += self._add_dictionary_word(word, nosuggest)
+        else:
+            lexicon = self.dictionary_lexicon(dict_word_cache_file, processes, stems_per_chunk)
+            with lexicon:
+                for (word, nosuggest) in lexicon:
+                    count += self._add_dictionary_word(word, nosuggest)
         print(count, "words added using add_unmunched_dictionary")
 
+    # Lexicon with unmunched dictionary words, using file as cache
+    def dictionary_lexicon(self, file: str, processes: int = 1, stems_per_chunk: int = 1000) -> Lexicon:
+        key = dictionary_key(self.dictionary, self.dictionary_path)
+        if os.path.isfile(file):
+            try:
+                lexicon = Lexicon(file)
+                if lexicon.key == key:
+                    return lexicon
+                lexicon.close()
+                print(f"{file} was created for different dictionary files, re-creating")
+            except (OSError, ValueError) as e:
+                print(f"error reading {file}, re-creating: {e}")
+        with tempfile.TemporaryDirectory() as spill_dir:
+            spill_files = unmunch_dictionary_files(self.dictionary, spill_dir, processes, stems_per_chunk)
+            write_lexicon(file, key, merge_word_files(spill_files, spill_dir))
+        return Lexicon(file)
+
+    # loads the unmunched dictionary words, so dictionary lookups of these words don't need spylls
+    #  spylls is still used for words that are not in the lexicon, e.g. compounds or invalid words
+    # this is useful when dictionary words should be recognized, but not added (otherwise use add_words_from_dictionary,
+    #  which makes the words known anyway)
+    # dict_word_cache_file is used as in add_words_from_dictionary, if None the dictionary is unmunched now
+    # if in_memory, words are loaded into a dict, otherwise the memory-mapped Lexicon is used (a bit slower lookups)
+    #  the dict needs much more memory (ca 100 MB for de_DE, the Lexicon file is 12 MB), the Lexicon file is shared
+    #  by all processes using it (also unrelated ones, e.g. builds for different corpora running at the same time)
+    def load_lexicon(self, dict_word_cache_file: str | None = None, in_memory: bool = True, processes: int = 1,
+                     stems_per_chunk: int = 1000):
+        if isinstance(self.lexicon, Lexicon):
+            self.lexicon.close()
+        self.lexicon = None
+        if dict_word_cache_file is None:
+            with tempfile.TemporaryDirectory() as spill_dir:
+                spill_files = unmunch_dictionary_files(self.dictionary, spill_dir, processes, stems_per_chunk)
+                if in_memory:
+                    self.lexicon = dict(merge_word_files(spill_files, spill_dir))
+                    return
+                # the file is memory-mapped, so it can be removed with the directory (on unix)
+                #  so the Lexicon can't be pickled, only forked workers can use it
+                lexicon_file = os.path.join(spill_dir, "lexicon")
+                key = dictionary_key(self.dictionary, self.dictionary_path)
+                write_lexicon(lexicon_file, key, merge_word_files(spill_files, spill_dir))
+                self.lexicon = Lexicon(lexicon_file, temporary=True)
+            return
+        lexicon = self.dictionary_lexicon(dict_word_cache_file, processes, stems_per_chunk)
+        if in_memory:
+            with lexicon:
+                self.lexicon = dict(lexicon)
+        else:
+            self.lexicon = lexicon
+
+    def _add_dictionary_word(self, word: str, nosuggest: bool) -> bool:
+        if word in self.ignore_words or word in self.word_infos:
+            return False
+        self.add_word(word, nosuggest)
+        return True
+
     # tries adding a line, which is a sentence or sentence fragment
     # if next-word information is not wanted, use add_word instead
     # currently ngram ends after every non-word character
@@ -195,93 +444,71 @@ class Wordlist:
                  add_unknown_words: bool = False) -> None:
         previous_word: str | None = None
         for word in line.split():
-            if word in self.word_infos:
-                # shortcut: we already know the word, avoid doing the regex check and dict lookup if possible
-                # only increase count and add next word info
-                self.add_word(word)
-                if previous_word is not None:
-                    previous_info = self.word_infos[previous_word]
-                    previous_next = previous_info.get("next", {})
-                    previous_next[word] = previous_next.get(word, 0) + 1
-                    previous_info["next"] = previous_next
-                previous_word = word
-                continue
-            if len(word) >= 48:
-                # android dicttool ignores those, so let's skip them already here
-                previous_word = None
-                continue
-            if word.isspace():
-                # don't treat spaces as countable word (assuming a line does not contain a line break)
-                continue
-            if word.isnumeric():
-                # don't put numbers info not_words
-                previous_word = None
-                continue
-            if "--" in word:
-                # words with "--" are seen as valid by spylls/hunspell, but we don't want them
+            previous_word = self._add_token(word, previous_word, add_unknown_words)
+
+    # adds a single token of a line, and returns the word that is the previous word for the next token
+    #  or None if the ngram ends here
+    # token is the result of classify_token(word), it's determined if not provided
+    def _add_token(self, word: str, previous_word: str | None, add_unknown_words: bool,
+                   token: tuple[int, str, str, bool] | None = None) -> str | None:
+        if word in self.word_infos:
+            # shortcut: we already know the word, avoid doing the regex check and dict lookup if possible
+            # only increase count and add next word info
+            self.add_word(word)
+            if previous_word is not None:
+                self.bigram_counts.add(previous_word, word)
+            return word
+        if token is None:
+            token = classify_token(word, self.possible_word_regex)
+        (kind, word, full_word, weird) = token
+        if kind != TOKEN_WORD:
+            if kind == TOKEN_SPACE:
+                return previous_word
+            if kind == TOKEN_INVALID:
                 self.invalid_words.add(word)
-                previous_word = None
-                continue
-            if not regex.search(r"\p{L}", word):
-                # no letters, no word (but ngram ends here)
+            elif kind == TOKEN_NOT_WORD:
                 self.not_words.add(word)
-                previous_word = None
-                continue
-            # hunspell dict has ', not ’, but we want to understand both
-            word = word.replace('’', '\'')
-            # must find something, because r"\p{L}" non-matches are already removed
-            re_find = regex.findall(self.possible_word_regex, word)
-            self.count += 1
-            if len(re_find) > 1:
-                # just write down and end sentence for now
-                self.weird_things.add(word)
-                previous_word = None
-            # treat re_find[0] as the actual word, but need to investigate weird_things to maybe improve possible_word_regex
-            full_word = word
-            word = re_find[0]
-            # if the match is not at the start, treat as ngram start
-            if not full_word.startswith(word):
-                previous_word = None
+            return None
+        self.count += 1
+        if weird:
+            # just write down and end sentence for now
+            self.weird_things.add(full_word)
+            previous_word = None
+        # if the match is not at the start, treat as ngram start
+        if not full_word.startswith(word):
+            previous_word = None
 
-            if word in self.ignore_words:
-                self.ignore_word_count += 1
-                previous_word = None
-                continue
+        if word in self.ignore_words:
+            self.ignore_word_count += 1
+            return None
 
-            if word in self.invalid_words:
-                previous_word = None
-                continue
+        if word in self.invalid_words:
+            return None
 
-            if word not in self.word_infos:
-                if add_unknown_words:
-                    if previous_word is None and word[0].isupper():
-                        continue
-                else:
-                    try:
-                        valid, word = self.dict_check(word, previous_word is None)
-                    except IndexError:
-                        # happens for "İsmail" when using German dictionary, also for other words starting with "İ"
-                        previous_word = None
-                        continue
-                    if not valid:
-                        if previous_word is not None:  # otherwise uppercase at sentence start would end up here
-                            self.invalid_words.add(word)
-                        previous_word = None
-                        continue
+        if word not in self.word_infos:
+            if add_unknown_words:
+                if previous_word is None and word[0].isupper():
+                    return None
+            else:
+                try:
+                    valid, word = self.dict_check(word, previous_word is None)
+                except IndexError:
+                    # happens for "İsmail" when using German dictionary, also for other words starting with "İ"
+                    return None
+                if not valid:
+                    if previous_word is not None:  # otherwise uppercase at sentence start would end up here
+                        self.invalid_words.add(word)
+                    return None
 
-            self.count_valid += 1
-            self.add_word(word, add_to_count=False)
+        self.count_valid += 1
+        self.add_word(word, add_to_count=False)
 
-            if previous_word is not None:
-                previous_info = self.word_infos[previous_word]
-                previous_next = previous_info.get("next", {})
-                previous_next[word] = previous_next.get(word, 0) + 1
-                previous_info["next"] = previous_next
-            # set new previous word, or None if ngram end is suspected (this could be optimized, but no priority)
-            if full_word.endswith(word):
-                previous_word = word
-            else:
-                previous_word = None
+        if previous_word is not None:
+            self.bigram_counts.add(previous_word, word)
+        # set new previous word, or None if ngram end is suspected (this could be optimized, but no priority)
+        if full_word.endswith(word):
+            return word
+        return None
 
     # returns whether word is valid according to the dictionary, and, for the case it was capitalized, the valid form
     def dict_check(self, word: str, try_decapitalize: bool) -> tuple[bool, str]:
@@ -289,29 +516,58 @@ class Wordlist:
             decapitalized = word[0].lower() + word[1:]
             if decapitalized in self.word_infos:
                 return True, decapitalized
+        else:
+            try_decapitalize = False
+        key = (word, try_decapitalize)
+        verdict = None
+        if self._verdicts is not None:
+            verdict = self._verdicts.get(key)
+        if verdict is None:
+            verdict = self.lookup_cache.get(key)
+            if verdict is None:
+                verdict = self._dictionary_verdict(word, try_decapitalize)
+                self.lookup_cache.put(key, verdict)
+            if self._verdicts is not None:
+                self._verdicts[key] = verdict
+        valid, word, nosuggest = verdict
+        if nosuggest:
+            self.word_infos[word] = {"nosuggest": True}
+        return valid, word
+
+    # returns whether word is valid according to the dictionary, the valid form, and whether it's nosuggest
+    # unlike dict_check, this only depends on the dictionary
+    def _dictionary_verdict(self, word: str, try_decapitalize: bool) -> tuple[bool, str, bool]:
+        if self.lexicon is not None:
+            # the lexicon contains exactly the words valid in a case-sensitive lookup, so a found word gives the same
+            #  result as the lookups below (words not found may still be valid, e.g. compounds)
+            nosuggest = self.lexicon.get(word)
+            if nosuggest is not None:
+                if not try_decapitalize or not nosuggest:
+                    return True, word, nosuggest
+                if self.lexicon.get(word[0].lower() + word[1:]) is False:
+                    return True, word[0].lower() + word[1:], False
+        if try_decapitalize:
+            decapitalized = word[0].lower() + word[1:]
             # todo: lookup can be slow, optimize order with capitalization and nosuggest
             if not self.dictionary.lookuper(word, capitalization=True, allow_nosuggest=True):
-                return False, word
+                return False, word, False
             # word may be valid, check capitalization and nosuggest
             if self.dictionary.lookuper(word, capitalization=False, allow_nosuggest=False):
-                return True, word
+                return True, word, False
             if self.dictionary.lookuper(decapitalized, capitalization=False, allow_nosuggest=False):
-                return True, decapitalized
+                return True, decapitalized, False
             if self.dictionary.lookuper(word, capitalization=False, allow_nosuggest=True):
-                self.word_infos[word] = {"nosuggest": True}
-                return True, word
+                return True, word, True
             if self.dictionary.lookuper(decapitalized, capitalization=False, allow_nosuggest=True):
-                self.word_infos[decapitalized] = {"nosuggest": True}
-                return True, decapitalized
-            return False, word
+                return True, decapitalized, True
+            return False, word, False
         # we always want correct capitalization
         # maybe invert order for better performance, similar to above
         if not self.dictionary.lookuper(word, capitalization=False, allow_nosuggest=True):
-            return False, word
+            return False, word, False
         if self.dictionary.lookuper(word, capitalization=False, allow_nosuggest=False):
-            return True, word
-        self.word_infos[word] = {"nosuggest": True}
-        return True, word
+            return True, word, False
+        return True, word, True
 
     def add_word(self, word: str, nosuggest: bool = False, add_to_count: bool = True):
         word_info = self.word_infos.get(word, {})
@@ -323,20 +579,290 @@ class Wordlist:
             self.count += 1
             self.count_valid += 1
 
-    def add_sentence_file(self, filename: str, add_unknown_words: bool = False):
-        with open(filename) as f:
-            for line in f:
+    # filename can also be a compressed file (.gz, .bz2, .xz), "-" for stdin, or a file object, see read_lines
+    # processes > 1 splits the file into parts, and the dictionary lookups for each part are done in worker processes
+    #  the lines are still added in this process, with the same result as processes=1
+    #  this needs an uncompressed file, otherwise the file is read in a single process
+    # two_pass first collects all distinct tokens and checks each of them only once, and then adds the lines
+    #  (with processes > 1, the distinct tokens are checked in worker processes)
+    #  this needs a file name, as the file is read twice
+    # if checkpoint is set, the state is saved to this file every checkpoint_interval seconds and when done, see
+    #  save_checkpoint (needs a file name, processes=1 and two_pass=False)
+    #  after load_checkpoint, the file is continued where the checkpoint was saved (or skipped if it was done)
+    def add_sentence_file(self, filename, add_unknown_words: bool = False, processes: int = 1,
+                          two_pass: bool = False, checkpoint: str | None = None, checkpoint_interval: float = 600):
+        if checkpoint is not None:
+            if processes > 1 or two_pass:
+                raise ValueError("checkpoint can't be used with processes > 1 or two_pass")
+            self._add_file_with_checkpoints(filename, checkpoint, checkpoint_interval,
+                                            lambda line: self.add_line(line, add_unknown_words))
+            return
+        if two_pass:
+            if not isinstance(filename, str) or filename == "-":
+                raise ValueError("two_pass needs a file name, as the file is read twice")
+            self._add_sentence_file_two_pass(filename, add_unknown_words, processes)
+            return
+        if processes > 1:
+            if is_plain_file(filename):
+                self._add_sentence_file_parallel(filename, add_unknown_words, processes)
+                return
+            print(f"can't split {filename} for reading in multiple processes, reading in a single process")
+        for line in read_lines(filename):
+            self.add_line(line, add_unknown_words)
+
+    # like add_sentence_file, but the work is split into stages connected by bounded queues (see pipeline.py):
+    #  read (read_lines, in batches of lines_per_batch lines) -> tokenize -> validate -> aggregate
+    # aggregate (adding the words in order, using the verdicts from validate) runs in this thread, the result is the
+    #  same as for add_sentence_file
+    # pipeline is the pipeline for tokenize and validate, by default sentence_pipeline(add_unknown_words)
+    # if stats_interval is set, pipeline stats are printed every stats_interval seconds
+    # returns the pipeline, so stats can be checked after running
+    def add_sentence_file_pipeline(self, filename, add_unknown_words: bool = False, pipeline: Pipeline | None = None,
+                                   lines_per_batch: int = 1000, stats_interval: float | None = None) -> Pipeline:
+        if pipeline is None:
+            pipeline = self.sentence_pipeline(add_unknown_words)
+        last_stats = time.time()
+        try:
+            for (lines, verdicts) in pipeline.run(batches(read_lines(filename), lines_per_batch)):
+                self._verdicts = verdicts
+                for tokens in lines:
+                    previous_word: str | None = None
+                    for (word, token) in tokens:
+                        previous_word = self._add_token(word, previous_word, add_unknown_words, token)
+                if stats_interval is not None and time.time() - last_stats >= stats_interval:
+                    pipeline.print_stats()
+                    last_stats = time.time()
+        finally:
+            self._verdicts = None
+        return pipeline
+
+    # pipeline for add_sentence_file_pipeline, items are batches of lines
+    #  tokenize: splits lines and classifies tokens that are not known words yet
+    #  validate: dictionary lookups that will likely be needed, not added if add_unknown_words or no dictionary
+    # validate is usually the slowest stage, but lookups hold the GIL, so more validator_workers only help with
+    #  validator_processes (which also avoids slowing down aggregate)
+    # stages may be changed or added, as long as the last stage returns (tokenized lines, verdicts)
+    def sentence_pipeline(self, add_unknown_words: bool = False, tokenizer_workers: int = 1,
+                          validator_workers: int = 1, validator_processes: bool = False,
+                          queue_size: int = 8) -> Pipeline:
+        stages = [Stage("tokenize", self._tokenize_lines, tokenizer_workers)]
+        if not add_unknown_words and self.dictionary is not None:
+            stages.append(Stage("validate", _LineValidator(self), validator_workers, validator_processes))
+        return Pipeline(stages, queue_size, source_name="read", sink_name="aggregate")
+
+    # returns [[(token, classify_token result or None if the token is a known word), ...] for each line], {}
+    def _tokenize_lines(self, lines: list[str]) -> tuple[list, dict]:
+        word_infos = self.word_infos
+        possible_word_regex = self.possible_word_regex
+        return [[(word, None if word in word_infos else classify_token(word, possible_word_regex))
+                 for word in line.split()] for line in lines], {}
+
+    # each worker process adds one shard (byte range) of the file on top of the current state, only to collect the
+    #  dictionary verdicts (the slow part), then the lines are added here in file order using these verdicts
+    # add_line is not independent of what was added before (e.g. a capitalized word at sentence start is
+    #  decapitalized if the lowercase word is already known), so adding all lines here gives the same result as
+    #  processes=1, and verdicts the workers didn't need (as they didn't know the words of earlier shards) are looked
+    #  up when adding
+    def _add_sentence_file_parallel(self, filename: str, add_unknown_words: bool, processes: int):
+        if not add_unknown_words and self.dictionary is not None:
+            shards = file_shards(filename, processes)
+            # fork, so the workers can use dictionary and current state without pickling
+            context = multiprocessing.get_context("fork")
+            with context.Pool(min(processes, len(shards)), initializer=_init_shard_worker,
+                              initargs=(self, filename)) as pool:
+                results = pool.map(_shard_verdicts, shards, chunksize=1)
+            self._verdicts = {}
+            for verdicts in results:
+                self._verdicts.update(verdicts)
+        try:
+            for line in read_lines(filename):
                 self.add_line(line, add_unknown_words)
+        finally:
+            self._verdicts = None
 
-    def add_word_file(self, filename: str):
-        with open(filename) as f:
-            for line in f:
+    # the first pass only splits lines, and collects the distinct tokens
+    # then each token is classified once, and the dictionary checks that will likely be needed are done once
+    # the second pass adds the lines as usual, but using the token classes and dictionary verdicts
+    # web corpora contain much fewer distinct tokens than tokens, so this is much faster than add_line for each line
+    #  the second pass is still needed because results depend on the order of the words (see _add_sentence_file_parallel)
+    def _add_sentence_file_two_pass(self, filename: str, add_unknown_words: bool, processes: int = 1):
+        line_starts: set[str] = set()
+        other_tokens: set[str] = set()
+        for line in read_lines(filename):
+            line_tokens = line.split()
+            if len(line_tokens) > 0:
+                line_starts.add(line_tokens[0])
+                other_tokens.update(line_tokens[1:])
+        tokens = {word: classify_token(word, self.possible_word_regex) for word in line_starts | other_tokens}
+        if not add_unknown_words and self.dictionary is not None:
+            checks = []
+            decapitalize_checks = []
+            for (raw_word, (kind, word, _, _)) in tokens.items():
+                if kind != TOKEN_WORD or word in self.word_infos or word in self.ignore_words:
+                    continue
+                if not word[0].isupper():
+                    checks.append((word, False))
+                    continue
+                # no need to check capitalized words as they are if they are only found at line start
+                if raw_word in other_tokens:
+                    checks.append((word, False))
+                decapitalize_checks.append((word, True))
+            self._verdicts = self.dictionary_verdicts(checks, processes)
+            remaining_checks = []
+            for (word, _) in decapitalize_checks:
+                # a word that is valid as it is will not be decapitalized
+                if self._verdicts.get((word, False)) == (True, word, False):
+                    self._verdicts[(word, True)] = (True, word, False)
+                    continue
+                # if the decapitalized word is valid, it's usually known when the capitalized word is checked
+                decapitalized_verdict = self._verdicts.get((word[0].lower() + word[1:], False))
+                if decapitalized_verdict is not None and decapitalized_verdict[0]:
+                    continue
+                remaining_checks.append((word, True))
+            self._verdicts.update(self.dictionary_verdicts(remaining_checks, processes))
+        else:
+            self._verdicts = {}
+        try:
+            for line in read_lines(filename):
+                previous_word: str | None = None
                 for word in line.split():
-                    re_find = regex.findall(self.possible_word_regex, word)
-                    if len(re_find) == 0:
-                        continue
-                    word = re_find[0]
-                    self.add_word(word)
+                    previous_word = self._add_token(word, previous_word, add_unknown_words, tokens[word])
+        finally:
+            self._verdicts = None
+
+    # returns _dictionary_verdict for each (word, try_decapitalize) in checks that can be checked
+    def dictionary_verdicts(self, checks: list[tuple[str, bool]], processes: int = 1) -> dict:
+        if processes > 1 and len(checks) > processes:
+            context = multiprocessing.get_context("fork")
+            chunk_size = math.ceil(len(checks) / processes)
+            chunks = [checks[i:i + chunk_size] for i in range(0, len(checks), chunk_size)]
+            verdicts = {}
+            with context.Pool(len(chunks), initializer=_init_verdict_worker, initargs=(self,)) as pool:
+                for chunk_verdicts in pool.map(_dictionary_verdicts, chunks, chunksize=1):
+                    verdicts.update(chunk_verdicts)
+            return verdicts
+        verdicts = {}
+        for (word, try_decapitalize) in checks:
+            try:
+                verdicts[(word, try_decapitalize)] = self._dictionary_verdict(word, try_decapitalize)
+            except IndexError:
+                # see _add_token, keep it for the actual check
+                pass
+        return verdicts
+
+    # filename can also be a compressed file, "-" for stdin, or a file object, see read_lines
+    # checkpoint works like for add_sentence_file
+    def add_word_file(self, filename, checkpoint: str | None = None, checkpoint_interval: float = 600):
+        if checkpoint is not None:
+            self._add_file_with_checkpoints(filename, checkpoint, checkpoint_interval, self._add_word_line)
+            return
+        for line in read_lines(filename):
+            self._add_word_line(line)
+
+    def _add_word_line(self, line: str):
+        for word in line.split():
+            re_find = regex.findall(self.possible_word_regex, word)
+            if len(re_find) == 0:
+                continue
+            word = re_find[0]
+            self.add_word(word)
+
+    # calls add_line for each line of the file, starting at the position in input_positions
+    # checkpoints are saved in background, so the next lines can be added while the checkpoint is written
+    def _add_file_with_checkpoints(self, filename: str, checkpoint: str, checkpoint_interval: float, add_line):
+        if not isinstance(filename, str) or filename == "-":
+            raise ValueError("checkpoint needs a file name")
+        key = os.path.abspath(filename)
+        last_checkpoint = time.time()
+        for (lines, position) in read_lines_with_positions(filename, self.input_positions.get(key, 0)):
+            for line in lines:
+                add_line(line)
+            self.input_positions[key] = position
+            if time.time() - last_checkpoint >= checkpoint_interval:
+                # if the previous checkpoint is still being written, try again with the next line
+                if self.save_checkpoint(checkpoint, background=True):
+                    last_checkpoint = time.time()
+        # final checkpoint is written before returning (waits for a pending background write)
+        self.save_checkpoint(checkpoint)
+
+    # saves everything added so far (but not dictionary and lookup cache) to filename, using pickle
+    #  a file is first written under a temporary name, so an interrupted write does not destroy the last checkpoint
+    # if background, the checkpoint is written by a forked process (working on a copy-on-write snapshot, so adding
+    #  can continue immediately), and False is returned if the previous checkpoint is still being written
+    #  use wait_for_checkpoint to make sure it's done
+    def save_checkpoint(self, filename: str, background: bool = False) -> bool:
+        if not background or not hasattr(os, "fork"):
+            self.wait_for_checkpoint()
+            self._write_checkpoint(filename)
+            return True
+        if self._checkpoint_pid is not None:
+            (pid, status) = os.waitpid(self._checkpoint_pid, os.WNOHANG)
+            if pid == 0:
+                return False
+            self._checkpoint_done(status)
+        pid = os.fork()
+        if pid == 0:
+            try:
+                self._write_checkpoint(filename)
+            except BaseException as e:
+                print(f"writing checkpoint {filename} failed: {e}", flush=True)
+                os._exit(1)
+            os._exit(0)
+        self._checkpoint_pid = pid
+        return True
+
+    def wait_for_checkpoint(self):
+        if self._checkpoint_pid is not None:
+            (_, status) = os.waitpid(self._checkpoint_pid, 0)
+            self._checkpoint_done(status)
+
+    def _checkpoint_done(self, status: int):
+        self._checkpoint_pid = None
+        if os.waitstatus_to_exitcode(status) != 0:
+            print(f"writing checkpoint failed with exit code {os.waitstatus_to_exitcode(status)}")
+
+    def _write_checkpoint(self, filename: str):
+        self.bigram_counts.compact()
+        state = {
+            "version": CHECKPOINT_VERSION,
+            "dictionary_path": self.dictionary_path,
+            "word_infos": self.word_infos,
+            "bigram_counts": self.bigram_counts,
+            "invalid_words": self.invalid_words,
+            "not_words": self.not_words,
+            "weird_things": self.weird_things,
+            "count": self.count,
+            "count_valid": self.count_valid,
+            "ignore_word_count": self.ignore_word_count,
+            "input_positions": self.input_positions,
+        }
+        temp_filename = filename + ".tmp"
+        with open(temp_filename, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_filename, filename)
+
+    # replaces the current state with the one saved by save_checkpoint, returns False if filename does not exist
+    # files added with checkpoint continue where they were when the checkpoint was saved, so the build can be resumed
+    #  by running the same code with load_checkpoint before adding anything
+    def load_checkpoint(self, filename: str) -> bool:
+        if not os.path.exists(filename):
+            return False
+        with open(filename, "rb") as f:
+            state = pickle.load(f)
+        if state.get("version") != CHECKPOINT_VERSION:
+            raise ValueError(f"{filename} has unsupported checkpoint version {state.get('version')}")
+        if state["dictionary_path"] != self.dictionary_path:
+            print(f"checkpoint was created with dictionary {state['dictionary_path']}, now using {self.dictionary_path}")
+        self.word_infos = state["word_infos"]
+        self.bigram_counts = state["bigram_counts"]
+        self.invalid_words = state["invalid_words"]
+        self.not_words = state["not_words"]
+        self.weird_things = state["weird_things"]
+        self.count = state["count"]
+        self.count_valid = state["count_valid"]
+        self.ignore_word_count = state["ignore_word_count"]
+        self.input_positions = state["input_positions"]
+        return True
 
     # when adding bigrams, the bigram f will be 1 for the most frequent, 2 for the next, then 3, ...
     # this creates warnings when compiling the dict, but it's the same for the original en_US AOSP wordlist
@@ -345,6 +871,7 @@ class Wordlist:
         min_frequency = 1
         max_frequency = 254
         min_next_word_count_for_bigram = 2  # just a single occurrence is not enough
+        uncertain_bigrams = 0
 
         (min_count, max_count) = min_max_counts(self.word_infos)
         if max_count == 0:
@@ -362,17 +889,410 @@ class Wordlist:
             attributes.f = int((f - min_f) * (max_frequency - min_frequency) / f_diff + min_frequency)
             if add_nosuggest and infos.get("nosuggest", False):
                 attributes.possibly_offensive = True
-            if add_bigrams and "next" in infos:
-                bigram_count = 1
-                for next_word, next_count in sorted(infos["next"].items(), key=lambda item: -item[1]):
-                    if next_count < min_next_word_count_for_bigram:
-                        break
+            if add_bigrams:
+                (next_words, uncertain) = self._next_words_for_bigrams(word, min_next_word_count_for_bigram)
+                uncertain_bigrams += uncertain
+                for (bigram_count, next_word) in enumerate(next_words, 1):
                     attributes.bigrams[next_word] = bigram_count
-                    bigram_count += 1
             wordlist.words[word] = attributes
 
+        if uncertain_bigrams > 0:
+            print(f"Warning: {uncertain_bigrams} bigrams not added, as their counts are not exact enough, "
+                  f"use BigramCounts or a BigramSketch with higher capacity or width")
         return wordlist
 
+    # next words of word occurring at least min_count times, most frequent first
+    # for the same count, next words that first followed word earlier come first (see next_counts of bigram_counts)
+    # with a BigramSketch only the lowest and highest possible count are known, so the next words are only used as long
+    #  as each of them is certainly more frequent than the first next word that is not used, and occurs at least
+    #  min_count times
+    # returns the next words, and the number of next words that may occur min_count times but are not used
+    def _next_words_for_bigrams(self, word: str, min_count: int) -> tuple[list[str], int]:
+        bounds = sorted(self.bigram_counts.next_count_bounds(word), key=lambda item: -item[2])
+        candidates = [bound for bound in bounds if bound[2] >= min_count]
+        used = 0
+        lowest = None
+        for (i, (_, lower, _)) in enumerate(candidates):
+            if lower < min_count:
+                break
+            lowest = lower if lowest is None else min(lowest, lower)
+            next_highest = bounds[i + 1][2] if i + 1 < len(bounds) else 0
+            if lowest >= next_highest:
+                used = i + 1
+        return [next_word for (next_word, _, _) in candidates[:used]], len(candidates) - used
+
+
+# kinds of tokens in a line, see classify_token
+TOKEN_WORD = 0  # possibly a word
+TOKEN_BREAK = 1  # not a word, ngram ends here
+TOKEN_SPACE = 2  # ignored
+TOKEN_INVALID = 3  # invalid word, ngram ends here
+TOKEN_NOT_WORD = 4  # contains no letters, ngram ends here
+# by group name in _token_regex
+TOKEN_KINDS = {"long": TOKEN_BREAK, "space": TOKEN_SPACE, "number": TOKEN_BREAK, "invalid": TOKEN_INVALID,
+               "not_word": TOKEN_NOT_WORD}
+
+
+# returns (kind, word, full word, weird) for a whitespace-separated token
+#  for TOKEN_WORD, word is the first match of possible_word_regex in the full word, and weird is whether
+#  there is more than one match
+def classify_token(word: str, possible_word_regex: str) -> tuple[int, str, str, bool]:
+    if possible_word_regex == Wordlist.possible_word_regex:
+        token = _classify_token_single_regex(word)
+        if token is not None:
+            return token
+    if len(word) >= 48:
+        # android dicttool ignores those, so let's skip them already here
+        return TOKEN_BREAK, word, word, False
+    if word.isspace():
+        # don't treat spaces as countable word (assuming a line does not contain a line break)
+        return TOKEN_SPACE, word, word, False
+    if word.isnumeric():
+        # don't put numbers info not_words
+        return TOKEN_BREAK, word, word, False
+    if "--" in word:
+        # words with "--" are seen as valid by spylls/hunspell, but we don't want them
+        return TOKEN_INVALID, word, word, False
+    if not regex.search(r"\p{L}", word):
+        # no letters, no word (but ngram ends here)
+        return TOKEN_NOT_WORD, word, word, False
+    # hunspell dict has ', not ’, but we want to understand both
+    word = word.replace('’', '\'')
+    # must find something, because r"\p{L}" non-matches are already removed
+    re_find = regex.findall(possible_word_regex, word)
+    # treat re_find[0] as the actual word, but need to investigate weird_things to maybe improve possible_word_regex
+    return TOKEN_WORD, re_find[0], word, len(re_find) > 1
+
+
+# classify_token for the default possible_word_regex with a single regex match, which is about three times as fast as the
+#  separate checks (see benchmarks.benchmark_classify_token)
+# returns None if the word is not matched
+def _classify_token_single_regex(word: str) -> tuple[int, str, str, bool] | None:
+    global _token_regex
+    if _token_regex is None:
+        _token_regex = _compile_token_regex()
+    match = _token_regex.fullmatch(word)
+    if match is None:
+        return None
+    kind = match.lastgroup
+    if kind == "word":
+        return TOKEN_WORD, match.group("possible_word").replace('’', '\''), word.replace('’', '\''), \
+            match.group("weird") is not None
+    return TOKEN_KINDS[kind], word, word, False
+
+
+_token_regex = None
+
+
+# one alternative for each case in classify_token, in the same order
+#  whitespace and numeric characters are taken from str.isspace and str.isnumeric (\s and \p{N} are slightly different)
+#  possible_word is the first match of Wordlist.possible_word_regex, with ’ treated like '
+#  weird is the first letter or digit after it, i.e. the start of a second match
+#  words that contain whitespace are not matched, but they can't be a token of line.split() anyway
+def _compile_token_regex():
+    space = _character_class(str.isspace)
+    numeric = _character_class(str.isnumeric)
+    return regex.compile(
+        f"(?s)(?P<long>.{{48,}})"
+        f"|(?P<space>[{space}]+)"
+        f"|(?P<number>[{numeric}]+)"
+        f"|(?P<invalid>[^{space}]*--[^{space}]*)"
+        f"|(?P<not_word>[^{space}\\p{{L}}]+)"
+        f"|(?P<word>[^{space}\\p{{L}}\\d]*+(?P<possible_word>[\\p{{L}}\\d'’-]+(?<!['’-]))"
+        f"[^{space}\\p{{L}}\\d]*+(?P<weird>[\\p{{L}}\\d])?[^{space}]*+)"
+    )
+
+
+# regex character class content (without brackets) for all characters matching predicate
+def _character_class(predicate) -> str:
+    ranges = []
+    for c in range(sys.maxunicode + 1):
+        if predicate(chr(c)):
+            if len(ranges) > 0 and ranges[-1][1] == c - 1:
+                ranges[-1][1] = c
+            else:
+                ranges.append([c, c])
+    return "".join(f"\\U{start:08x}-\\U{end:08x}" for (start, end) in ranges)
+
+
+# least recently used cache for dictionary lookup results, with hit and miss counters
+class LookupCache:
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        self.entries[key] = value
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
+
+
+# splits file into up to count byte ranges (start, end), each starting at the beginning of a line
+def file_shards(filename: str, count: int) -> list[tuple[int, int]]:
+    size = os.path.getsize(filename)
+    boundaries = [0]
+    with open(filename, "rb") as f:
+        for i in range(1, count):
+            # start one byte early, so we don't skip a line if we hit the start of a line
+            f.seek(max(size * i // count - 1, boundaries[-1]))
+            f.readline()
+            boundaries.append(min(f.tell(), size))
+    boundaries.append(size)
+    return [(start, end) for (start, end) in zip(boundaries, boundaries[1:]) if end > start]
+
+
+COMPRESSED_FILE_OPENERS = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+# size of blocks read from the file (decompressed size for compressed files)
+READ_BLOCK_SIZE = 1 << 20
+# maximum number of blocks that are read ahead
+READ_AHEAD_BLOCKS = 8
+
+
+def is_plain_file(source) -> bool:
+    return isinstance(source, str) and source != "-" and os.path.splitext(source)[1] not in COMPRESSED_FILE_OPENERS
+
+
+# yields the lines of source like open(filename) would (including universal newlines)
+# source can be a file name, a compressed file name (.gz, .bz2, .xz), "-" for stdin, or a file object opened in text
+#  or binary mode (which is not closed)
+# reading, decompressing, decoding and splitting lines is done in large blocks in a background thread, so adding the
+#  lines does not need to wait for it (decompression releases the GIL)
+#  at most READ_AHEAD_BLOCKS blocks are kept in memory
+def read_lines(source):
+    blocks = queue.Queue(READ_AHEAD_BLOCKS)
+    stop = threading.Event()
+    reader = threading.Thread(target=_read_line_blocks, args=(source, blocks, stop), daemon=True)
+    reader.start()
+    try:
+        while True:
+            block = blocks.get()
+            if isinstance(block, BaseException):
+                raise block
+            if block is None:
+                return
+            yield from block
+    finally:
+        stop.set()
+        reader.join()
+
+
+# puts lists of lines into blocks, then None when done (or the exception if reading fails)
+def _read_line_blocks(source, blocks: queue.Queue, stop: threading.Event):
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                blocks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    try:
+        encoding = locale.getpreferredencoding(False)
+        if source == "-":
+            # read bytes, so decoding is done in large blocks too
+            f = sys.stdin.buffer
+            encoding = sys.stdin.encoding
+        elif isinstance(source, str):
+            f = COMPRESSED_FILE_OPENERS.get(os.path.splitext(source)[1], open)(source, "rb")
+        else:
+            f = source
+        try:
+            if isinstance(f, io.TextIOBase):
+                decoder = None
+            else:
+                decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder(encoding)(), translate=True)
+            rest = ""
+            while not stop.is_set():
+                data = f.read(READ_BLOCK_SIZE)
+                final = len(data) == 0
+                text = data if decoder is None else decoder.decode(data, final)
+                lines = (rest + text).split("\n")
+                rest = lines.pop()
+                lines = [line + "\n" for line in lines]
+                if final and len(rest) > 0:
+                    # last line without line break
+                    lines.append(rest)
+                if len(lines) > 0 and not put(lines):
+                    return
+                if final:
+                    break
+        finally:
+            if isinstance(source, str) and source != "-":
+                f.close()
+        put(None)
+    except BaseException as e:
+        put(e)
+
+
+# yields (lines, position after the lines) for each line of the file starting at byte position start
+#  usually lines is a single line, but like for open(filename) (universal newlines), lines with \r are split
+#  for compressed files, positions are in the decompressed data
+def read_lines_with_positions(filename: str, start: int = 0):
+    encoding = locale.getpreferredencoding(False)
+    with COMPRESSED_FILE_OPENERS.get(os.path.splitext(filename)[1], open)(filename, "rb") as f:
+        f.seek(start)
+        position = start
+        for raw_line in f:
+            position += len(raw_line)
+            line = raw_line.decode(encoding)
+            if "\r" in line:
+                yield list(io.StringIO(line, newline=None)), position
+            else:
+                yield [line], position
+
+
+# reads lines in the given byte range, like open(filename) would (including universal newlines)
+def read_file_shard(filename: str, start: int, end: int):
+    encoding = locale.getpreferredencoding(False)
+    with open(filename, "rb") as f:
+        f.seek(start)
+        position = start
+        while position < end:
+            raw_line = f.readline()
+            if len(raw_line) == 0:
+                break
+            position += len(raw_line)
+            line = raw_line.decode(encoding)
+            if "\r" in line:
+                yield from io.StringIO(line, newline=None)
+            else:
+                yield line
+
+
+_shard_worker_args = None
+
+
+def _init_shard_worker(wordlist: Wordlist, filename: str):
+    global _shard_worker_args
+    _shard_worker_args = (wordlist, filename)
+
+
+_unmunch_worker_dictionary = None
+
+
+def _init_unmunch_worker(dictionary: Dictionary):
+    global _unmunch_worker_dictionary
+    _unmunch_worker_dictionary = dictionary
+
+
+def _unmunch_chunk(chunk: tuple[int, int, str]) -> str:
+    (start, end, spill_dir) = chunk
+    dictionary = _unmunch_worker_dictionary
+    index = affix_index(dictionary)
+    words = set()
+    for word in dictionary.dic.words[start:end]:
+        words.update(unmunch_word(word, dictionary.aff, index))
+    valid_words = []
+    for word in words:
+        nosuggest = valid_dictionary_word(dictionary, word)
+        if nosuggest is not None:
+            valid_words.append((word, nosuggest))
+    valid_words.sort()
+    file = os.path.join(spill_dir, f"chunk_{start}.txt")
+    with open(file, "w", encoding="utf-8", newline="\n") as f:
+        f.writelines(f"{word}\t{int(nosuggest)}\n" for (word, nosuggest) in valid_words)
+    return file
+
+
+# validate stage of Wordlist.sentence_pipeline: adds _dictionary_verdict results for the words in tokenized lines
+#  that will likely be checked in dict_check
+# whether a word is checked (and with try_decapitalize) depends on the words added before, which are not known yet
+#  when a batch is validated, so this is a guess, and anything missing is looked up when adding
+# each worker (thread or process) has its own lookup cache
+class _LineValidator:
+    def __init__(self, wordlist: Wordlist):
+        self.wordlist = wordlist
+        self.local = threading.local()
+
+    def __call__(self, batch: tuple[list, dict]) -> tuple[list, dict]:
+        (lines, verdicts) = batch
+        wordlist = self.wordlist
+        cache = getattr(self.local, "cache", None)
+        if cache is None:
+            cache = LookupCache(wordlist.lookup_cache.max_size)
+            self.local.cache = cache
+        for tokens in lines:
+            ngram_start = True
+            for (raw_word, token) in tokens:
+                if token is None:
+                    ngram_start = False
+                    continue
+                (kind, word, full_word, weird) = token
+                if kind != TOKEN_WORD:
+                    if kind != TOKEN_SPACE:
+                        ngram_start = True
+                    continue
+                try_decapitalize = (ngram_start or weird or not full_word.startswith(word)) and word[0].isupper()
+                ngram_start = not full_word.endswith(word)
+                if word in wordlist.word_infos or word in wordlist.ignore_words or word in wordlist.invalid_words:
+                    continue
+                if try_decapitalize and word[0].lower() + word[1:] in wordlist.word_infos:
+                    continue
+                key = (word, try_decapitalize)
+                if key in verdicts:
+                    continue
+                verdict = cache.get(key)
+                if verdict is None:
+                    try:
+                        verdict = wordlist._dictionary_verdict(word, try_decapitalize)
+                    except IndexError:
+                        # see _add_token, keep it for the actual check
+                        continue
+                    cache.put(key, verdict)
+                verdicts[key] = verdict
+        return lines, verdicts
+
+
+# yields lists of up to size items
+def batches(items, size: int):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if len(batch) > 0:
+        yield batch
+
+
+_verdict_worker_wordlist = None
+
+
+def _init_verdict_worker(wordlist: Wordlist):
+    global _verdict_worker_wordlist
+    _verdict_worker_wordlist = wordlist
+
+
+def _dictionary_verdicts(checks: list[tuple[str, bool]]) -> dict:
+    return _verdict_worker_wordlist.dictionary_verdicts(checks)
+
+
+# dictionary verdicts needed for adding the lines of the shard to the wordlist of the worker (a forked copy)
+def _shard_verdicts(shard: tuple[int, int]) -> dict:
+    (wordlist, filename) = _shard_worker_args
+    wordlist._verdicts = {}
+    for line in read_file_shard(filename, shard[0], shard[1]):
+        wordlist.add_line(line)
+    return wordlist._verdicts
+
 
 def min_max_counts(word_infos: dict) -> (int, int):
     max_count = 0
@@ -412,18 +1332,50 @@ def hun_loc(loc: str) -> str:
         return loc
 
 
-def find_dict(loc: str) -> Dictionary:
-    try:
-        d = Dictionary.from_system(loc)
-        return d
-    except LookupError:
-        pass
+def find_dict(loc: str, cache_dir: str | None = None) -> Dictionary:
+    return load_dictionary(find_dict_path(loc, cache_dir), cache_dir)
+
+
+# found dictionary paths by locale
+_dict_paths: dict[str, str] = {}
+
+
+# path of the dictionary files for the locale, without .aff / .dic
+# same search as Dictionary.from_system, but the path is needed for dictionary_key
+# found paths are remembered, and also stored in cache_dir (if provided) for other processes
+def find_dict_path(loc: str, cache_dir: str | None = None) -> str:
+    path = _dict_paths.get(loc)
+    if path is not None and os.path.isfile(path + ".aff"):
+        return path
+    paths_file = os.path.join(cache_dir, "dictionary_paths.json") if cache_dir is not None else None
+    stored_paths = {}
+    if paths_file is not None and os.path.isfile(paths_file):
+        try:
+            with open(paths_file, encoding="utf-8") as f:
+                stored_paths = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"error reading {paths_file}: {e}")
+    path = stored_paths.get(loc)
+    if path is None or not os.path.isfile(path + ".aff"):
+        path = _search_dict_path(loc)
+        if paths_file is not None:
+            stored_paths[loc] = path
+            os.makedirs(cache_dir, exist_ok=True)
+            temp_filename = f"{paths_file}.{os.getpid()}.tmp"
+            with open(temp_filename, "w", encoding="utf-8") as f:
+                json.dump(stored_paths, f, indent=1)
+            os.replace(temp_filename, paths_file)
+    _dict_paths[loc] = path
+    return path
+
+
+def _search_dict_path(loc: str) -> str:
     h_loc = hun_loc(loc)
-    try:
-        d = Dictionary.from_system(h_loc)
-        return d
-    except LookupError:
-        pass
+    for name in (loc, h_loc):
+        for folder in Dictionary.PATHES:
+            paths = glob.glob(f"{folder}/{name}.aff")
+            if paths:
+                return paths[0].replace(".aff", "")
     try:
         import phunspell
         dict_path = f"{phunspell.__path__[0]}/data/dictionary/"
@@ -431,7 +1383,103 @@ def find_dict(loc: str) -> Dictionary:
         raise FileNotFoundError("dictionary not found")
     language = loc.split("_")[0]
     if os.path.isdir(f"{dict_path}/{language}"):
-        return Dictionary.from_files(f"{dict_path}/{language}/{h_loc}")
+        return f"{dict_path}/{language}/{h_loc}"
     elif os.path.isdir(f"{dict_path}/{h_loc}"):
-        return Dictionary.from_files(f"{dict_path}/{h_loc}/{h_loc}")
+        return f"{dict_path}/{h_loc}/{h_loc}"
     raise FileNotFoundError("dictionary not found")
+
+
+# parsed dictionary from path (without .aff / .dic)
+# if cache_dir is provided, a pickled snapshot of the dictionary is stored there, and used instead of parsing the
+#  files again as long as the files, spylls and python versions are the same (loading is ca 10x faster than parsing)
+# garbage collection is paused while loading, as it takes most of the time when creating the many objects
+#  of a dictionary (and there is nothing to collect)
+def load_dictionary(path: str, cache_dir: str | None = None) -> Dictionary:
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        if cache_dir is None:
+            return Dictionary.from_files(path)
+        key = dictionary_snapshot_key(path)
+        snapshot_file = os.path.join(cache_dir, f"{os.path.basename(path)}_"
+                                                f"{hashlib.sha256(os.path.abspath(path).encode()).hexdigest()[:16]}.pickle")
+        if os.path.isfile(snapshot_file):
+            try:
+                with open(snapshot_file, "rb") as f:
+                    # the key is stored first, so the dictionary is only loaded if it's still valid
+                    if pickle.load(f) == key:
+                        return pickle.load(f)
+                print(f"{snapshot_file} was created for different dictionary files, re-creating")
+            except (OSError, EOFError, ValueError, pickle.UnpicklingError) as e:
+                print(f"error reading {snapshot_file}, re-creating: {e}")
+        dictionary = Dictionary.from_files(path)
+        os.makedirs(cache_dir, exist_ok=True)
+        temp_filename = f"{snapshot_file}.{os.getpid()}.tmp"
+        with open(temp_filename, "wb") as f:
+            pickle.dump(key, f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(dictionary, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_filename, snapshot_file)
+        return dictionary
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+# identifies dictionary files and everything else a pickled dictionary depends on
+def dictionary_snapshot_key(path: str) -> bytes:
+    try:
+        spylls_version = importlib.metadata.version("spylls")
+    except importlib.metadata.PackageNotFoundError:
+        spylls_version = "unknown"
+    h = hashlib.sha256(f"snapshot {DICTIONARY_SNAPSHOT_VERSION} spylls {spylls_version} "
+                       f"python {sys.version_info[0]}.{sys.version_info[1]}\n".encode())
+    _hash_dictionary_files(h, path)
+    return h.digest()
+
+
+# identifies dictionary content and unmunch code, for checking whether cached unmunch results are still valid
+# uses the dictionary files if the path is known, otherwise the parsed dictionary
+def dictionary_key(dictionary: Dictionary, dictionary_path: str | None = None) -> bytes:
+    h = hashlib.sha256(f"unmunch {UNMUNCH_VERSION}\n".encode())
+    if dictionary_path is not None:
+        _hash_dictionary_files(h, dictionary_path)
+    else:
+        _fingerprint(h, dictionary.aff)
+        _fingerprint(h, dictionary.dic.words)
+    return h.digest()
+
+
+def _hash_dictionary_files(h, path: str):
+    for extension in (".aff", ".dic"):
+        with open(path + extension, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+
+
+# adds a representation of value to the hash that does not depend on set order, or on object ids in repr
+def _fingerprint(h, value):
+    if dataclasses.is_dataclass(value):
+        h.update(type(value).__name__.encode())
+        for field in dataclasses.fields(value):
+            _fingerprint(h, getattr(value, field.name))
+    elif isinstance(value, dict):
+        h.update(b"{")
+        for key in sorted(value, key=repr):
+            _fingerprint(h, key)
+            _fingerprint(h, value[key])
+        h.update(b"}")
+    elif isinstance(value, (set, frozenset)):
+        h.update(b"<")
+        for item in sorted(value, key=repr):
+            _fingerprint(h, item)
+        h.update(b">")
+    elif isinstance(value, (list, tuple)):
+        h.update(b"[")
+        for item in value:
+            _fingerprint(h, item)
+        h.update(b"]")
+    elif isinstance(value, regex.Pattern) or isinstance(value, re.Pattern):
+        _fingerprint(h, value.pattern)
+    else:
+        h.update(repr(value).encode())
+        h.update(b",")
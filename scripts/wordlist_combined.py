@@ -1,10 +1,25 @@
 #!/bin/python
 from __future__ import annotations
 import os
+import gc
 import gzip
-import time
-import tempfile
+import io
+import itertools
 import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+READ_BUFFER_SIZE = 1 << 20
+# maximum number of distinct attribute texts remembered when reading
+MAX_PARSED_ATTRIBUTES = 100000
+# characters of formatted entries written at once, for .gz files each chunk is compressed to a separate gzip member
+WRITE_CHUNK_SIZE = 1 << 20
+# same as gzip.open, word lists are committed to the repo
+GZIP_LEVEL = 9
 
 # todo:
 #  allow adding shortcuts
@@ -12,21 +27,104 @@ import shutil
 
 
 class WordAttributes:
+    # word lists may have a million words, so keep it small
+    # bigrams, shortcuts and unknown are stored as None if empty, or as flat tuple (key, value, key, value, ...)
+    #  when read from file, and only converted to dict when accessed
+    #  use bigram_items, shortcut_items and unknown_items for reading without conversion
+    #  shortcuts read from file keep a shortcut occurring more than once for the word (dicttool writes all of them)
+    __slots__ = ("f", "possibly_offensive", "not_a_word", "_bigrams", "_shortcuts", "_unknown")
+
     def __init__(self):
         self.f: int = 0
         self.possibly_offensive: bool = False
         self.not_a_word: bool = False
-        self.bigrams: dict[str, int] = dict()
-        self.shortcuts: dict[str, str] = dict()  # but f can be "whitelist", maybe use string?
+        self._bigrams: dict[str, int] | tuple | None = None
+        self._shortcuts: dict[str, str] | tuple | None = None  # but f can be "whitelist", maybe use string?
         #  or is f=15 always whitelist?
         #  test shortcut with f=15 vs f=whitelist
         #   and word with f=whitelist
         # there are others, like flags=*, or whitelist=*, but those don't seem to have an effect
-        self.unknown: dict[str, str] = dict()  # flags=, originalFreq=, whitelist=, and more
+        self._unknown: dict[str, str] | tuple | None = None  # flags=, originalFreq=, whitelist=, and more
+
+    @property
+    def bigrams(self) -> dict[str, int]:
+        if type(self._bigrams) is not dict:
+            self._bigrams = _as_dict(self._bigrams)
+        return self._bigrams
+
+    @bigrams.setter
+    def bigrams(self, bigrams: dict[str, int]):
+        self._bigrams = bigrams
+
+    @property
+    def shortcuts(self) -> dict[str, str]:
+        if type(self._shortcuts) is not dict:
+            self._shortcuts = _as_dict(self._shortcuts)
+        return self._shortcuts
+
+    @shortcuts.setter
+    def shortcuts(self, shortcuts: dict[str, str]):
+        self._shortcuts = shortcuts
+
+    @property
+    def unknown(self) -> dict[str, str]:
+        if type(self._unknown) is not dict:
+            self._unknown = _as_dict(self._unknown)
+        return self._unknown
+
+    @unknown.setter
+    def unknown(self, unknown: dict[str, str]):
+        self._unknown = unknown
+
+    # copy that can be modified without changing this one (flat tuples are shared, they are never modified)
+    def copy(self) -> WordAttributes:
+        attributes = WordAttributes()
+        attributes.f = self.f
+        attributes.possibly_offensive = self.possibly_offensive
+        attributes.not_a_word = self.not_a_word
+        attributes._bigrams = dict(self._bigrams) if type(self._bigrams) is dict else self._bigrams
+        attributes._shortcuts = dict(self._shortcuts) if type(self._shortcuts) is dict else self._shortcuts
+        attributes._unknown = dict(self._unknown) if type(self._unknown) is dict else self._unknown
+        return attributes
+
+    def bigram_items(self):
+        return _items(self._bigrams)
+
+    def shortcut_items(self):
+        return _items(self._shortcuts)
+
+    def unknown_items(self):
+        return _items(self._unknown)
+
+
+def _as_dict(items: tuple | None) -> dict:
+    if items is None:
+        return dict()
+    return dict(zip(items[::2], items[1::2]))
+
+
+def _items(items: dict | tuple | None):
+    if items is None:
+        return ()
+    if type(items) is dict:
+        return items.items()
+    return zip(items[::2], items[1::2])
+
+
+# dict as flat tuple (key, value, key, value, ...), None if empty
+def _as_tuple(items: dict) -> tuple | None:
+    if len(items) == 0:
+        return None
+    return tuple(itertools.chain.from_iterable(items.items()))
 
 
 class DictionaryHeader:
-    def __init__(self, locale: str, dict_type: str = "main", description: str = " ", version: int = 18, date: int = int(time.time())):
+    # attributes written by write, others are kept in other
+    ATTRIBUTES = ("dictionary", "locale", "description", "date", "version")
+
+    # other: further attributes (e.g. MULTIPLE_WORDS_DEMOTION_RATE), written after the others, as dicttool keeps them
+    def __init__(self, locale: str, dict_type: str = "main", description: str = " ", version: int = 18, date: int = int(time.time()),
+                 other: dict[str, str] | None = None):
         if version < 18:
             print(f"Warning: Version is {version}, dictionaries with version < 18"
                   f" may be ignored by some AOSP-based keyboard apps.")
@@ -42,12 +140,15 @@ class DictionaryHeader:
                   f" but the locale might not be recognized by the keyboard")
         self.locale: str = locale
         self.date = date
+        self.other: dict[str, str] = dict(other) if other is not None else {}
 
     def write(self):
-        if self.locale == "de" or self.locale.split("_")[0] == "de":
+        if (self.locale == "de" or self.locale.split("_")[0] == "de") \
+                and "REQUIRES_GERMAN_UMLAUT_PROCESSING" not in self.other:
             add = ",REQUIRES_GERMAN_UMLAUT_PROCESSING=1"
         else:
             add = ""
+        add += "".join(f",{name}={value}" for (name, value) in self.other.items())
         return f"dictionary={self.type}:{self.locale.lower()},locale={self.locale},description={self.description}," \
                f"date={self.date},version={self.version}{add}"
 
@@ -82,7 +183,12 @@ class DictionaryHeader:
             date = int(time.time())
         else:
             date = int(date)
-        return DictionaryHeader(locale, actual_dict_type, description, version, date)
+        other = {}
+        for attribute in split:
+            (name, _, value) = attribute.partition("=")
+            if name not in DictionaryHeader.ATTRIBUTES:
+                other[name] = value
+        return DictionaryHeader(locale, actual_dict_type, description, version, date, other)
 
 
 class WordlistCombined:
@@ -103,7 +209,7 @@ class WordlistCombined:
     def filter_bigrams(self, max_bigram_count: int = 3, max_f: int = -1):
         for word, attributes in self.words.items():
             bigram_count = 1  # number of bigrams that are kept
-            for (next_word, f) in sorted(attributes.bigrams.items(), key=lambda item: item[1]):
+            for (next_word, f) in sorted(attributes.bigram_items(), key=lambda item: item[1]):
                 if bigram_count > max_bigram_count:
                     # we already have enough
                     del attributes.bigrams[next_word]
@@ -153,81 +259,182 @@ class WordlistCombined:
             bigrams=True,  # add bigrams to target (overwrite if same bigram exists with different f)
             other=True  # add other (unknown) attributes to target (overwrite if same attribute exists with different value)
     ):
+        self.merge_lists([source], words=words, f=f, possibly_offensive=possibly_offensive, not_a_word=not_a_word,
+                         shortcuts=shortcuts, bigrams=bigrams, other=other)
+
+    # merges all sources into this list in a single pass, in the order of sources, without modifying the sources
+    # sources can be dicts of WordAttributes, WordlistCombined, word list files (read while merging, so they are not
+    #  loaded completely) or iterables of (word, WordAttributes), e.g. from read_entries
+    # f of words in sources is multiplied by the weight of the source (default 1, result limited to 0 - 255), and
+    #  combined with f of the word in this list depending on f:
+    #  keep: f of this list, or of the first source with the word (if new)
+    #  overwrite: f of the last source with the word
+    #  average: average of this list and all sources with the word, weighted by weights (this list has weight 1, and
+    #   f is not multiplied by the weight)
+    #  max: highest f
+    #  sum: sum of f (e.g. for counts from separate corpora), limited to 255
+    # shortcuts, bigrams and other (unknown attributes): True or "overwrite" to use the value of the last source for the
+    #  same shortcut / bigram / attribute, "keep" to add only new ones, False to ignore them
+    # possibly_offensive and not_a_word are set if True and set for the word in any source
+    def merge_lists(
+            self,
+            sources: list,
+            weights: list[float] | None = None,
+            words: bool = True,
+            f: str = "keep",
+            possibly_offensive: bool = True,
+            not_a_word: bool = True,
+            shortcuts: bool | str = True,
+            bigrams: bool | str = True,
+            other: bool | str = True
+    ):
+        if weights is None:
+            weights = [1] * len(sources)
+        elif len(weights) != len(sources):
+            raise ValueError(f"got {len(weights)} weights for {len(sources)} sources")
+        if f not in ("keep", "overwrite", "average", "max", "sum"):
+            raise ValueError(f"unknown f policy: {f}")
+        for policy in (shortcuts, bigrams, other):
+            if policy not in (True, False, "overwrite", "keep"):
+                raise ValueError(f"unknown policy: {policy}")
         target = self.words
-        for x in source.items():
-            (word, attributes) = x
-            if word not in target:
-                if words:
-                    target[word] = attributes
-                    if not bigrams:
-                        attributes.bigrams = {}
+        averages = dict()  # word -> [weighted sum of f, sum of weights, count], only for f == "average"
+        for (source, weight) in zip(sources, weights):
+            for (word, attributes) in _source_items(source):
+                if f == "average" or weight == 1:
+                    word_f = attributes.f
+                else:
+                    word_f = min(255, max(0, int(attributes.f * weight)))
+                existing = target.get(word)
+                if existing is None:
+                    if not words:
+                        continue
+                    existing = attributes.copy()
+                    existing.f = word_f
+                    if not possibly_offensive:
+                        existing.possibly_offensive = False
                     if not not_a_word:
-                        attributes.not_a_word = False
+                        existing.not_a_word = False
                     if not shortcuts:
-                        attributes.shortcuts = {}
+                        existing._shortcuts = None
+                    if not bigrams:
+                        existing._bigrams = None
                     if not other:
-                        attributes.unknown = {}
-                    if not possibly_offensive:
-                        attributes.possibly_offensive = False
-                continue
-            if f == "overwrite":
-                target[word].f = attributes.f
-            elif f == "average":
-                target[word].f = int((attributes.f + target.f) / 2)
-            # else keep
-            if shortcuts:
-                for (shortcut, f) in attributes.shortcuts.items():
-                    target[word].shortcuts[shortcut] = f
-            if bigrams:  # todo: this will likely result in several bigrams with the same f -> what do? should not be bad though
-                for (bigram, f) in attributes.bigrams.items():
-                    target[word].bigrams[bigram] = f
-            if possibly_offensive and attributes.possibly_offensive:
-                target[word].possibly_offensive = True
-            if not_a_word and attributes.not_a_word:
-                target[word].not_a_word = True
-            if other:
-                for (name, value) in attributes.unknown.items():
-                    target[word].unknown[name] = value
-
-    def write_to_file(self, filename: str):
-        if filename.endswith(".gz"):
-            with gzip.open(filename, 'wt') as f:
-                write_it(self, f)
-        else:
-            with open(filename, 'w') as f:
-                write_it(self, f)
+                        existing._unknown = None
+                    target[word] = existing
+                    if f == "average":
+                        averages[word] = [word_f * weight, weight, 1]
+                    continue
+
+                if f == "overwrite":
+                    existing.f = word_f
+                elif f == "average":
+                    average = averages.get(word)
+                    if average is None:
+                        average = [existing.f, 1, 1]
+                        averages[word] = average
+                    average[0] += word_f * weight
+                    average[1] += weight
+                    average[2] += 1
+                elif f == "max":
+                    existing.f = max(existing.f, word_f)
+                elif f == "sum":
+                    existing.f = min(255, existing.f + word_f)
+                # else keep
+                if possibly_offensive and attributes.possibly_offensive:
+                    existing.possibly_offensive = True
+                if not_a_word and attributes.not_a_word:
+                    existing.not_a_word = True
+                if shortcuts and attributes._shortcuts is not None:
+                    _merge_items(existing.shortcuts, attributes.shortcut_items(), shortcuts == "keep")
+                # todo: this will likely result in several bigrams with the same f -> what do? should not be bad though
+                if bigrams and attributes._bigrams is not None:
+                    _merge_items(existing.bigrams, attributes.bigram_items(), bigrams == "keep")
+                if other and attributes._unknown is not None:
+                    _merge_items(existing.unknown, attributes.unknown_items(), other == "keep")
+        for (word, (f_sum, weight_sum, count)) in averages.items():
+            # a word found only once keeps its f (the division may not give exactly the same number)
+            if count > 1 and weight_sum > 0:
+                target[word].f = int(f_sum / weight_sum)
+
+    # writes the word list sorted by decreasing f, if filename ends with ".gz" it's compressed with compress_level,
+    #  using threads for compression (default: number of CPUs)
+    def write_to_file(self, filename: str, compress_level: int = GZIP_LEVEL, threads: int | None = None):
+        entries = sorted(self.words.items(), key=lambda item: -item[1].f)
+        write_chunks(filename, format_chunks(self.header, entries), compress_level, threads)
 
-    def compile(self, target_path: str, overwrite: bool = True):
+    # writes the binary dictionary, target_path is the .dict file or the directory for it (file name from header)
+    # the file is meant to be the same dicttool would create from the file written by write_to_file, but java is not
+    #  needed (checked for the word lists in this repository, see generate_source_entries.py --check)
+    # if dicttool, dicttool_aosp.jar in the parent directory is run with java instead
+    def compile(self, target_path: str, overwrite: bool = True, dicttool: bool = False):
+        # binary_dict imports this module
+        from binary_dict import write_binary_dict
         if self.header is None:
             raise ValueError("Error: can't compile without header")
+        if target_path.endswith(".dict"):
+            (target_path, dictfilename) = os.path.split(target_path)
+        else:
+            dictfilename = f"{self.header.type}_{self.header.locale.lower()}.dict"
+        dictfile = os.path.join(target_path, dictfilename)
+        if not overwrite and os.path.isfile(dictfile):
+            print(f"Error: file {dictfile} already exists, not writing")
+            return
+        if target_path != "" and not os.path.exists(target_path):
+            os.mkdir(target_path)
+        if dicttool:
+            self._compile_with_dicttool(dictfile)
+            return
+        write_binary_dict(dictfile, self.header, sorted(self.words.items(), key=lambda item: -item[1].f))
+
+    def _compile_with_dicttool(self, dictfile: str):
         dicttool = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dicttool_aosp.jar")
         if not os.path.isfile(dicttool):
             raise FileNotFoundError("Error: dicttool_aosp.jar not found in parent directory")
+        if shutil.which("java") is None:
+            raise FileNotFoundError("Error: java not found, needed for dicttool")
         with tempfile.TemporaryDirectory() as tmpdir:
-            if target_path.endswith(".dict"):
-                (target_path, dictfilename) = os.path.split(target_path)
-            else:
-                dictfilename = f"{self.header.type}_{self.header.locale.lower()}.dict"
-            dictfile = os.path.join(tmpdir, dictfilename)
-            if not overwrite and os.path.isfile(dictfile):
-                print(f"Error: file {dictfile} already exists, not writing")
-                return
             filename = os.path.join(tmpdir, f"{self.header.locale.lower()}_{self.header.type}.combined")
             self.write_to_file(filename)
-            execute = f"java -jar {dicttool} makedict -s {filename} -d {dictfile} > /dev/null"
-            os.system(execute)
-            if not os.path.exists(target_path):
-                os.mkdir(target_path)
-            shutil.move(dictfile, os.path.join(target_path, dictfilename))
+            temp_dictfile = os.path.join(tmpdir, os.path.basename(dictfile))
+            subprocess.run(["java", "-jar", dicttool, "makedict", "-s", filename, "-d", temp_dictfile],
+                           stdout=subprocess.DEVNULL, check=True)
+            shutil.move(temp_dictfile, dictfile)
 
     @classmethod
     def read_from_file(cls, filename: str) -> WordlistCombined:
+        with open_word_list(filename) as f:
+            return read_it(f)
+
+
+# (word, WordAttributes) of a source for WordlistCombined.merge_lists
+def _source_items(source):
+    if isinstance(source, WordlistCombined):
+        return source.words.items()
+    if isinstance(source, dict):
+        return source.items()
+    if isinstance(source, str):
+        return read_entries(source)
+    return source
+
+
+def _merge_items(target: dict, items, keep: bool):
+    for (key, value) in items:
+        if keep and key in target:
+            continue
+        target[key] = value
+
+
+# opens a word list for reading, or writing if mode is "w"
+# read in large blocks, the default buffer size is rather small for large (compressed) files
+def open_word_list(filename: str, mode: str = "r"):
+    if mode == "r":
         if filename.endswith(".gz"):
-            with gzip.open(filename, 'rt') as f:
-                return read_it(f)
-        else:
-            with open(filename, 'r') as f:
-                return read_it(f)
+            return io.TextIOWrapper(io.BufferedReader(gzip.open(filename, 'rb'), READ_BUFFER_SIZE))
+        return open(filename, 'r', buffering=READ_BUFFER_SIZE)
+    if filename.endswith(".gz"):
+        return gzip.open(filename, 'wt')
+    return open(filename, 'w')
 
 
 def get_attribute(attributes: list[str], match: str) -> str | None:
@@ -237,79 +444,250 @@ def get_attribute(attributes: list[str], match: str) -> str | None:
     return None
 
 
+# parses each line only once, without get_attribute and list.remove, as this is slow for large word lists
+# attributes after the word are usually the same for many words (e.g. "f=120,flags=,originalFreq=120"), so they are
+#  parsed only once for each distinct text
+# garbage collection is paused while reading, as it's mostly busy with checking the many new attributes
 def read_it(file) -> WordlistCombined:
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return _read_it(file)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def _read_it(file) -> WordlistCombined:
     word_list = dict()
     header = None
+    for (word, attributes) in _parse(file):
+        if word is None:
+            header = attributes
+        else:
+            word_list[word] = attributes
+    return WordlistCombined(header=header, words=word_list)
+
+
+# yields (word, WordAttributes) for each word in file, in file order
+# if header is True, the DictionaryHeader is yielded first (None if the file doesn't start with a header)
+# unlike read_it, a word occurring more than once is yielded more than once
+def iter_entries(file, header: bool = False):
+    header_missing = header
+    for (word, attributes) in _parse(file):
+        if word is None:
+            if header_missing:
+                header_missing = False
+                yield attributes
+            continue
+        if header_missing:
+            header_missing = False
+            yield None
+        yield word, attributes
+    if header_missing:
+        yield None
+
+
+# like iter_entries, but opens the file (can be .gz)
+def read_entries(filename: str, header: bool = False):
+    with open_word_list(filename) as f:
+        yield from iter_entries(f, header)
+
+
+# yields (word, WordAttributes) for each word, and (None, DictionaryHeader) for each header line
+#  words are yielded once all their bigrams and shortcuts are read
+def _parse(file):
     current_word = None
     current_attributes = None
+    parsed_word_attributes = dict()
+    parsed_f = dict()
+    bigrams = dict()  # of the current word, stored as tuple when the word is complete
+    # flat (shortcut, f, ...) of the current word, duplicates are kept as dicttool writes them to the dictionary
+    shortcuts = []
     for line in file:
         if line.startswith("dictionary"):
-            header = DictionaryHeader.parse(line)
-        if len(line) == 0:
-            continue
-        # extract word, frequency, possibly_offensive, not_a_word
-        split = line.rstrip().split(",")
-        i = 0
+            yield None, DictionaryHeader.parse(line)
+        (first, _, rest) = line.rstrip().partition(",")
         # deal with e.g. "word=a, f=5": the space is allowed, but obstructs parsing
-        for s in split:
-            split[i] = s.lstrip()
-            i += 1
-        if split[0].startswith("word="):
+        first = first.lstrip()
+        if first.startswith("word="):
             if current_word is not None:
-                word_list[current_word] = current_attributes
-            current_word = split[0].split("word=")[1]
+                if bigrams:
+                    current_attributes._bigrams = _as_tuple(bigrams)
+                    bigrams = dict()
+                if shortcuts:
+                    current_attributes._shortcuts = tuple(shortcuts)
+                    shortcuts = []
+                yield current_word, current_attributes
+            current_word = first[5:].partition("word=")[0]
+            parsed = parsed_word_attributes.get(rest)
+            if parsed is None:
+                if len(parsed_word_attributes) > MAX_PARSED_ATTRIBUTES:
+                    parsed_word_attributes.clear()
+                parsed = parse_word_attributes(rest)
+                parsed_word_attributes[rest] = parsed
             current_attributes = WordAttributes()
-            current_attributes.f = int(get_attribute(split, "f="))
-            split.remove(f"f={current_attributes.f}")
-            possibly_offensive = get_attribute(split, "possibly_offensive=")
-            if possibly_offensive == "true":
-                current_attributes.possibly_offensive = True
-                split.remove("possibly_offensive=true")
-            not_a_word = get_attribute(split, "not_a_word=")
-            if not_a_word == "true":
-                current_attributes.not_a_word = True
-                split.remove("not_a_word=true")
-            if len(split) > 1:
-                # the rest is "unknown"
-                for attribute in split[1:]:
-                    (name, value) = attribute.split("=")
-                    current_attributes.unknown[name] = value
-        elif split[0].startswith("shortcut="):
-            shortcut = split[0].split("shortcut=")[1]
-            f = get_attribute(split, "f=")  # can be "whitelist", thus not necessarily int
-            current_attributes.shortcuts[shortcut] = f
-        elif split[0].startswith("bigram="):
-            bigram = split[0].split("bigram=")[1]
-            f = int(get_attribute(split, "f="))
-            current_attributes.bigrams[bigram] = f
+            (current_attributes.f, current_attributes.possibly_offensive, current_attributes.not_a_word, unknown) = \
+                parsed
+            current_attributes._unknown = unknown
+        elif first.startswith("shortcut="):
+            shortcut = first[9:].partition("shortcut=")[0]
+            shortcuts += (shortcut, get_f(rest))  # f can be "whitelist", thus not necessarily int
+        elif first.startswith("bigram="):
+            bigram = first[7:].partition("bigram=")[0]
+            f = parsed_f.get(rest)
+            if f is None:
+                if len(parsed_f) > MAX_PARSED_ATTRIBUTES:
+                    parsed_f.clear()
+                f = int(get_f(rest))
+                parsed_f[rest] = f
+            bigrams[bigram] = f
     if current_word is not None:
-        word_list[current_word] = current_attributes
-    return WordlistCombined(header=header, words=word_list)
+        if bigrams:
+            current_attributes._bigrams = _as_tuple(bigrams)
+        if shortcuts:
+            current_attributes._shortcuts = tuple(shortcuts)
+        yield current_word, current_attributes
+
+
+# parses the attributes after word=..., returns f, possibly_offensive, not_a_word and unknown attributes
+#  (as flat tuple, see WordAttributes)
+def parse_word_attributes(attributes: str) -> tuple[int, bool, bool, tuple | None]:
+    f = None
+    possibly_offensive = None
+    not_a_word = None
+    unknown = dict()
+    for attribute in attributes.split(","):
+        (name, _, value) = attribute.lstrip().partition("=")
+        # only the first f, possibly_offensive and not_a_word are used, others are treated as unknown
+        if name == "f" and f is None:
+            f = int(value)
+            continue
+        if name == "possibly_offensive" and possibly_offensive is None:
+            possibly_offensive = value == "true"
+            if possibly_offensive:
+                continue
+        elif name == "not_a_word" and not_a_word is None:
+            not_a_word = value == "true"
+            if not_a_word:
+                continue
+        (name, value) = attribute.lstrip().split("=")
+        # the same few names (and often values) are used for all words
+        unknown[sys.intern(name)] = sys.intern(value)
+    if f is None:
+        raise ValueError(f"no frequency in {attributes}")
+    return f, bool(possibly_offensive), bool(not_a_word), _as_tuple(unknown)
+
+
+# value of the first "f=" attribute, None if there is none
+def get_f(attributes: str) -> str | None:
+    for attribute in attributes.split(","):
+        attribute = attribute.lstrip()
+        if attribute.startswith("f="):
+            return attribute[2:].partition("f=")[0]
+    return None
 
 
 def write_it(wordlist: WordlistCombined, file):
-    if wordlist.header is None:
+    for chunk in format_chunks(wordlist.header, sorted(wordlist.words.items(), key=lambda item: -item[1].f)):
+        file.write(chunk)
+
+
+# writes header and (word, WordAttributes) entries to the file (can be .gz), in the given order
+# entries can be a generator, e.g. from read_entries, so large lists can be converted or filtered without loading
+#  them completely (but note that dicttool expects words sorted by decreasing f)
+def write_entries(filename: str, entries, header: DictionaryHeader | None = None, compress_level: int = GZIP_LEVEL,
+                  threads: int | None = None):
+    write_chunks(filename, format_chunks(header, entries), compress_level, threads)
+
+
+# writes text chunks to the file
+# for .gz files, each chunk is compressed to a separate gzip member in threads (zlib releases the GIL), so the file is
+#  compressed in parallel, and can still be read by gzip.open and dicttool (which read all members)
+#  members don't contain the time, so the same word list gives the same file
+def write_chunks(filename: str, chunks, compress_level: int = GZIP_LEVEL, threads: int | None = None):
+    if not filename.endswith(".gz"):
+        with open_word_list(filename, "w") as f:
+            for chunk in chunks:
+                f.write(chunk)
+        return
+    if threads is None:
+        threads = os.cpu_count() or 1
+
+    def compress(chunk: str) -> bytes:
+        return gzip.compress(chunk.encode("utf-8"), compress_level, mtime=0)
+
+    with open(filename, "wb") as f:
+        if threads <= 1:
+            for chunk in chunks:
+                f.write(compress(chunk))
+            return
+        with ThreadPoolExecutor(threads) as executor:
+            # limit chunks in memory, and keep the order
+            pending = deque()
+            for chunk in chunks:
+                pending.append(executor.submit(compress, chunk))
+                if len(pending) >= 2 * threads:
+                    f.write(pending.popleft().result())
+            while len(pending) > 0:
+                f.write(pending.popleft().result())
+
+
+# header and entries formatted to text chunks of about WRITE_CHUNK_SIZE characters
+def format_chunks(header: DictionaryHeader | None, entries):
+    chunk = [format_header(header)]
+    size = len(chunk[0])
+    unknown_texts = dict()
+    for (word, attributes) in entries:
+        text = format_entry(word, attributes, unknown_texts)
+        chunk.append(text)
+        size += len(text)
+        if size >= WRITE_CHUNK_SIZE:
+            yield "".join(chunk)
+            chunk = []
+            size = 0
+    if len(chunk) > 0:
+        yield "".join(chunk)
+
+
+def write_header(header: DictionaryHeader | None, file):
+    file.write(format_header(header))
+
+
+def format_header(header: DictionaryHeader | None) -> str:
+    if header is None:
         print("Warning: wordlist without header, resulting wordlist.combined will not compile")
-    else:
-        file.write(wordlist.header.write() + "\n")
-    for x in sorted(wordlist.words.items(), key=lambda item: -item[1].f):
-        (word, attributes) = x
-        if attributes.not_a_word:
-            not_a_word = ",not_a_word=true"
-        else:
-            not_a_word = ""
-        if attributes.possibly_offensive:
-            possibly_offensive = ",possibly_offensive=true"
-        else:
-            possibly_offensive = ""
-        if len(attributes.unknown) > 0:
-            unknown = ""
-            for (name, value) in attributes.unknown.items():
-                unknown += f",{name}={value}"
-        else:
-            unknown = ""
-        file.write(f" word={word},f={attributes.f}{not_a_word}{possibly_offensive}{unknown}\n")
-        for (bigram_word, bigram_f) in sorted(attributes.bigrams.items(), key=lambda item: item[1]):
-            file.write(f"  bigram={bigram_word},f={bigram_f}\n")
-        for (shortcut_word, shortcut_f) in attributes.shortcuts.items():
-            file.write(f"  shortcut={shortcut_word},f={shortcut_f}\n")
+        return ""
+    return header.write() + "\n"
+
+
+def write_entry(word: str, attributes: WordAttributes, file):
+    file.write(format_entry(word, attributes))
+
+
+# entry lines for the word, ending with line break
+# unknown_texts remembers the text of unknown attributes, which are usually the same for many words (like for reading)
+def format_entry(word: str, attributes: WordAttributes, unknown_texts: dict | None = None) -> str:
+    lines = [f" word={word},f={attributes.f}"]
+    if attributes.not_a_word:
+        lines.append(",not_a_word=true")
+    if attributes.possibly_offensive:
+        lines.append(",possibly_offensive=true")
+    unknown = attributes._unknown
+    if unknown is not None:
+        text = unknown_texts.get(unknown) if unknown_texts is not None and type(unknown) is tuple else None
+        if text is None:
+            text = "".join(f",{name}={value}" for (name, value) in attributes.unknown_items())
+            if unknown_texts is not None and type(unknown) is tuple:
+                if len(unknown_texts) > MAX_PARSED_ATTRIBUTES:
+                    unknown_texts.clear()
+                unknown_texts[unknown] = text
+        lines.append(text)
+    lines.append("\n")
+    if attributes._bigrams is not None:
+        for (bigram_word, bigram_f) in sorted(attributes.bigram_items(), key=lambda item: item[1]):
+            lines.append(f"  bigram={bigram_word},f={bigram_f}\n")
+    if attributes._shortcuts is not None:
+        for (shortcut_word, shortcut_f) in attributes.shortcut_items():
+            lines.append(f"  shortcut={shortcut_word},f={shortcut_f}\n")
+    return "".join(lines)